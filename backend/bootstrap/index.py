@@ -0,0 +1,127 @@
+import json
+import os
+from typing import Dict, Any, List, Optional
+from function_runtime import (
+    JSON_HEADERS, LATEST_CHANGE_SEQ_SQL, ResponseCache, bad_request_response, build_etag,
+    cached_response, fetch_json_fragments, get_db_connection, is_not_modified, json_object_text,
+    map_layer_sql, method_not_allowed_response, preflight_headers, release_db_connection,
+    trace_span, traced
+)
+
+# Слои карты и таблицы data_versions, от которых они зависят
+LAYER_TABLES = {
+    'marks': 'marks',
+    'planned': 'planned_treatments',
+    'current': 'current_treatments',
+    'news': 'news'
+}
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=30, stale-while-revalidate=300'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 16
+GZIP_MIN_SIZE = 1024
+
+PREFLIGHT_HEADERS = preflight_headers('GET, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, gzip_min_size=GZIP_MIN_SIZE)
+
+def get_bootstrap_version(cursor, layers: List[str]) -> str:
+    # Одним запросом читаются версии всех запрошенных слоёв; ETag меняется при изменении любого из них
+    tables = [LAYER_TABLES[layer] for layer in layers]
+    cursor.execute('SELECT table_name, version FROM data_versions WHERE table_name = ANY(%s)', (tables,))
+    versions = dict(cursor.fetchall())
+    return '.'.join(str(versions.get(table_name, 0)) for table_name in tables)
+
+def parse_layers(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(LAYER_TABLES)
+    
+    layers = [layer.strip() for layer in value.split(',') if layer.strip()]
+    if not layers or any(layer not in LAYER_TABLES for layer in layers):
+        raise ValueError('Неизвестный слой карты')
+    return [layer for layer in LAYER_TABLES if layer in layers]
+
+@traced('bootstrap')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Начальная загрузка карты одним запросом: метки, запланированные и текущие обработки, новости
+    Args: event - HTTP запрос с параметрами layers (marks,planned,current,news) и verified
+          context - контекст выполнения функции
+    Returns: JSON со всеми слоями карты в том же формате, что у отдельных функций
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if method != 'GET':
+        return method_not_allowed_response()
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        layers = parse_layers(query_params.get('layers'))
+    except ValueError:
+        return bad_request_response()
+    
+    verified_only = query_params.get('verified') == 'true'
+    response_cache_key = json.dumps(query_params, sort_keys=True)
+    
+    cached = _response_cache.lookup(response_cache_key)
+    if cached:
+        return cached_response(cached, event)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        version = get_bootstrap_version(cursor, layers)
+        
+        cached = _response_cache.lookup(response_cache_key, version)
+        if cached:
+            return cached_response(cached, event)
+        
+        # Неподтверждённые метки меняются часто, поэтому как и GET /marks такой ответ всегда перепроверяется
+        public = verified_only or 'marks' not in layers
+        cache_headers = {
+            **headers,
+            'ETag': build_etag('bootstrap', version, query_params),
+            'Cache-Control': PUBLIC_CACHE_CONTROL if public else REVALIDATE_CACHE_CONTROL,
+            'Vary': 'Accept-Encoding'
+        }
+        
+        if is_not_modified(event, cache_headers['ETag']):
+            return {
+                'statusCode': 304,
+                'headers': cache_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        # Все слои одним оператором в одном снимке данных; номер последнего изменения читается тем же
+        # оператором, поэтому лента ?since=<seq> продолжается ровно с состояния отданных меток
+        fragments: Dict[str, str] = {}
+        if 'marks' in layers:
+            fragments['seq'] = LATEST_CHANGE_SEQ_SQL
+            fragments['marks'] = map_layer_sql('marks', ['verified = true'] if verified_only else [])
+        for layer in layers:
+            if layer != 'marks':
+                fragments[layer] = map_layer_sql(layer)
+        
+        response_fragments = fetch_json_fragments(cursor, fragments)
+        with trace_span('serialize'):
+            body = json_object_text(response_fragments)
+        _response_cache.store(response_cache_key, version, cache_headers, body)
+        return cached_response(_response_cache[response_cache_key], event)
+    
+    finally:
+        cursor.close()
+        release_db_connection(conn)
@@ -0,0 +1,243 @@
+import json
+import math
+import os
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from function_runtime import (
+    JSON_HEADERS, ResponseCache, bad_request_response, build_etag, cached_response,
+    get_db_connection, is_not_modified, method_not_allowed_response, parse_bbox,
+    preflight_headers, release_db_connection, trace_span, traced
+)
+
+ROLLUP_CELL_SIZE = 0.01
+DEFAULT_DAYS = 30
+MAX_DAYS = 3660
+DEFAULT_HOT_MIN_MARKS = 5
+MAX_GAP_CELLS = 200
+MAX_ZONE_MARK_IDS = 200
+REPORTS = ('inside', 'gaps')
+COVERAGE_TABLES = ('marks', 'planned_treatments', 'current_treatments')
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=300, stale-while-revalidate=3600'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 64
+
+PREFLIGHT_HEADERS = preflight_headers('GET, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+def get_coverage_version(cursor) -> str:
+    # Дата входит в версию: активность зон зависит от CURRENT_DATE
+    cursor.execute(
+        'SELECT table_name, version FROM data_versions WHERE table_name = ANY(%s)',
+        (list(COVERAGE_TABLES),)
+    )
+    versions = dict(cursor.fetchall())
+    return '.'.join(str(versions.get(table_name, 0)) for table_name in COVERAGE_TABLES) + f'.{date.today().isoformat()}'
+
+def fetch_marks_in_zones(cursor, zones: str, since: date, verified_only: bool, mark_type: Optional[str], bbox: Optional[Tuple[float, float, float, float]]) -> List[Dict[str, Any]]:
+    # Метки каждой зоны выбираются по GiST-индексу idx_marks_point (point <@ polygon), без перебора всех пар
+    mark_conditions = ['m.created_at >= %s']
+    mark_params: List[Any] = [since]
+    if verified_only:
+        mark_conditions.append('m.verified = true')
+    if mark_type:
+        mark_conditions.append('m.type = %s')
+        mark_params.append(mark_type)
+    
+    if zones == 'planned':
+        table_name = 'planned_treatments'
+        date_columns = 'z.planned_date, NULL::date'
+        zone_conditions = ['z.planned_date >= CURRENT_DATE']
+    else:
+        table_name = 'current_treatments'
+        date_columns = 'z.start_date, z.end_date'
+        zone_conditions = ["z.status = 'active'", 'z.end_date >= CURRENT_DATE']
+    
+    zone_conditions.append('z.area IS NOT NULL')
+    zone_params: List[Any] = []
+    if bbox:
+        zone_conditions.append('z.area && polygon(box(point(%s, %s), point(%s, %s)))')
+        zone_params.extend(bbox)
+    
+    cursor.execute(f'''
+        SELECT 
+            z.id, z.area_name, z.type, {date_columns},
+            COUNT(m.id),
+            COUNT(m.id) FILTER (WHERE m.type = 'tick'),
+            COUNT(m.id) FILTER (WHERE m.type = 'hogweed'),
+            (array_agg(m.id ORDER BY m.id DESC) FILTER (WHERE m.id IS NOT NULL))[1:%s]
+        FROM {table_name} z
+        LEFT JOIN marks m ON point(m.longitude, m.latitude) <@ z.area AND {' AND '.join(mark_conditions)}
+        WHERE {' AND '.join(zone_conditions)}
+        GROUP BY z.id
+        ORDER BY COUNT(m.id) DESC, z.id
+    ''', [MAX_ZONE_MARK_IDS] + mark_params + zone_params)
+    
+    result = []
+    for row in cursor.fetchall():
+        zone = {
+            'id': row[0],
+            'area': row[1],
+            'type': row[2],
+            'marks': row[5],
+            'tick': row[6],
+            'hogweed': row[7],
+            'markIds': row[8] or []
+        }
+        if zones == 'planned':
+            zone['date'] = row[3].isoformat()
+        else:
+            zone['startDate'] = row[3].isoformat()
+            zone['endDate'] = row[4].isoformat()
+        result.append(zone)
+    
+    return result
+
+def fetch_uncovered_hot_cells(cursor, since: date, min_marks: int, verified_only: bool, mark_type: Optional[str], bbox: Optional[Tuple[float, float, float, float]]) -> List[Dict[str, Any]]:
+    # Центр каждого участка проверяется по GiST-индексам зон через LATERAL ... LIMIT 1
+    conditions = ['day >= %s']
+    params: List[Any] = [since]
+    if verified_only:
+        conditions.append('verified = true')
+    if mark_type:
+        conditions.append('type = %s')
+        params.append(mark_type)
+    if bbox:
+        conditions.append('cell_lng BETWEEN %s AND %s AND cell_lat BETWEEN %s AND %s')
+        params.extend([
+            math.floor(bbox[0] / ROLLUP_CELL_SIZE), math.floor(bbox[2] / ROLLUP_CELL_SIZE),
+            math.floor(bbox[1] / ROLLUP_CELL_SIZE), math.floor(bbox[3] / ROLLUP_CELL_SIZE)
+        ])
+    params.extend([min_marks, MAX_GAP_CELLS])
+    
+    cursor.execute(f'''
+        WITH hot AS (
+            SELECT 
+                type, cell_lat, cell_lng, SUM(mark_count) AS mark_count,
+                polygon(box(
+                    point((cell_lng + 0.5) * {ROLLUP_CELL_SIZE}, (cell_lat + 0.5) * {ROLLUP_CELL_SIZE}),
+                    point((cell_lng + 0.5) * {ROLLUP_CELL_SIZE}, (cell_lat + 0.5) * {ROLLUP_CELL_SIZE})
+                )) AS center
+            FROM marks_daily_rollup
+            WHERE {' AND '.join(conditions)}
+            GROUP BY type, cell_lat, cell_lng
+            HAVING SUM(mark_count) >= %s
+        )
+        SELECT h.type, h.cell_lat, h.cell_lng, h.mark_count
+        FROM hot h
+        LEFT JOIN LATERAL (
+            SELECT 1 AS covered
+            FROM planned_treatments p
+            WHERE p.area @> h.center AND p.type = h.type AND p.planned_date >= CURRENT_DATE
+            LIMIT 1
+        ) planned ON true
+        LEFT JOIN LATERAL (
+            SELECT 1 AS covered
+            FROM current_treatments c
+            WHERE c.area @> h.center AND c.type = h.type AND c.status = 'active' AND c.end_date >= CURRENT_DATE
+            LIMIT 1
+        ) active ON true
+        WHERE planned.covered IS NULL AND active.covered IS NULL
+        ORDER BY h.mark_count DESC, h.cell_lat, h.cell_lng
+        LIMIT %s
+    ''', params)
+    
+    return [
+        {
+            'type': row[0],
+            'lat': round((row[1] + 0.5) * ROLLUP_CELL_SIZE, 6),
+            'lng': round((row[2] + 0.5) * ROLLUP_CELL_SIZE, 6),
+            'marks': row[3]
+        }
+        for row in cursor.fetchall()
+    ]
+
+@traced('coverage')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Связь меток с зонами обработки: метки внутри действующих зон и очаги без запланированной обработки
+    Args: event - HTTP запрос с параметрами report (inside|gaps), zones, days, min, type, verified, bbox
+          context - контекст выполнения функции
+    Returns: JSON со списком зон и числом меток в них или списком участков без обработки
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if method != 'GET':
+        return method_not_allowed_response()
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        report = query_params.get('report', 'inside')
+        zones = query_params.get('zones', 'current')
+        days = int(query_params.get('days', DEFAULT_DAYS))
+        min_marks = int(query_params.get('min', DEFAULT_HOT_MIN_MARKS))
+        mark_type = query_params.get('type')
+        bbox = parse_bbox(query_params['bbox']) if query_params.get('bbox') else None
+        if report not in REPORTS or zones not in ('current', 'planned') or mark_type not in (None, 'tick', 'hogweed'):
+            raise ValueError('Неизвестный отчёт, тип зон или тип меток')
+        if not 1 <= days <= MAX_DAYS or min_marks < 1:
+            raise ValueError('Некорректный период или порог')
+    except ValueError:
+        return bad_request_response()
+    
+    verified_only = query_params.get('verified') == 'true'
+    since = date.today() - timedelta(days=days)
+    response_cache_key = json.dumps(query_params, sort_keys=True)
+    
+    cached = _response_cache.lookup(response_cache_key)
+    if cached:
+        return cached_response(cached, event)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        version = get_coverage_version(cursor)
+        
+        cached = _response_cache.lookup(response_cache_key, version)
+        if cached:
+            return cached_response(cached, event)
+        
+        cache_headers = {
+            **headers,
+            'ETag': build_etag('coverage', version, query_params),
+            'Cache-Control': PUBLIC_CACHE_CONTROL
+        }
+        
+        if is_not_modified(event, cache_headers['ETag']):
+            return {
+                'statusCode': 304,
+                'headers': cache_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        if report == 'gaps':
+            response_body = {
+                'cells': fetch_uncovered_hot_cells(cursor, since, min_marks, verified_only, mark_type, bbox),
+                'cellSize': ROLLUP_CELL_SIZE
+            }
+        else:
+            response_body = {'zones': fetch_marks_in_zones(cursor, zones, since, verified_only, mark_type, bbox)}
+        response_body['since'] = since.isoformat()
+        
+        with trace_span('serialize'):
+            body = json.dumps(response_body)
+        _response_cache.store(response_cache_key, version, cache_headers, body)
+        return cached_response(_response_cache[response_cache_key], event)
+    
+    finally:
+        cursor.close()
+        release_db_connection(conn)
@@ -0,0 +1,291 @@
+import base64
+import json
+import math
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from function_runtime import (
+    JSON_HEADERS, bad_request_response, build_etag, get_data_version, get_db_connection,
+    is_not_modified, method_not_allowed_response, preflight_headers, release_db_connection,
+    traced, traced_phase
+)
+
+REGION_LAT = (54.0, 57.0)
+REGION_LNG = (35.0, 40.0)
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 365
+DEFAULT_RESOLUTION = 20
+RESOLUTIONS = (10, 20, 40, 80)
+HALF_LIFE_DAYS = 7.0
+SMOOTHING_SIGMA = 1.0
+FULL_RECOMPUTE_INTERVAL = 3600
+DECAY_REFRESH_INTERVAL = 600
+HEATMAP_CACHE_MAX_ENTRIES = 16
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=300, stale-while-revalidate=3600'
+
+PREFLIGHT_HEADERS = preflight_headers('GET, OPTIONS')
+
+_heatmap_cache: 'OrderedDict[Tuple[str, int, int], Dict[str, Any]]' = OrderedDict()
+
+def gaussian_kernel(sigma: float) -> 'np.ndarray':
+    import numpy as np
+    
+    radius = max(1, int(math.ceil(3 * sigma)))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+def smooth(grid: 'np.ndarray', sigma: float) -> 'np.ndarray':
+    import numpy as np
+    
+    kernel = gaussian_kernel(sigma)
+    radius = len(kernel) // 2
+    height, width = grid.shape
+    
+    padded = np.pad(grid, ((0, 0), (radius, radius)))
+    rows = sum(weight * padded[:, i:i + width] for i, weight in enumerate(kernel))
+    
+    padded = np.pad(rows, ((radius, radius), (0, 0)))
+    return sum(weight * padded[i:i + height, :] for i, weight in enumerate(kernel))
+
+def bin_marks(grid: 'np.ndarray', rows: list, reference_time: float, sign: float = 1.0):
+    import numpy as np
+    
+    if not rows:
+        return
+    
+    data = np.array([(row[0], row[1], row[2]) for row in rows], dtype=np.float64)
+    age_days = (reference_time - data[:, 2]) / 86400.0
+    weights = sign * np.exp2(-np.clip(age_days, 0, None) / HALF_LIFE_DAYS)
+    
+    height, width = grid.shape
+    lat_idx = ((data[:, 0] - REGION_LAT[0]) / (REGION_LAT[1] - REGION_LAT[0]) * height).astype(np.int64)
+    lng_idx = ((data[:, 1] - REGION_LNG[0]) / (REGION_LNG[1] - REGION_LNG[0]) * width).astype(np.int64)
+    np.clip(lat_idx, 0, height - 1, out=lat_idx)
+    np.clip(lng_idx, 0, width - 1, out=lng_idx)
+    
+    np.add.at(grid, (lat_idx, lng_idx), weights)
+
+def marks_conditions(mark_type: str, window_start: float) -> Tuple[List[str], list]:
+    # Начало окна передается числом секунд, чтобы полный расчет, добавление и вычитание меток делили одну границу
+    conditions = ['verified = true', "created_at >= to_timestamp(%s) AT TIME ZONE 'UTC'"]
+    params: list = [window_start]
+    if mark_type != 'all':
+        conditions.append('type = %s')
+        params.append(mark_type)
+    return conditions, params
+
+def fetch_marks(cursor, mark_type: str, window_start: float, after_id: Optional[int] = None, verified_after: Optional[Any] = None) -> list:
+    conditions, params = marks_conditions(mark_type, window_start)
+    
+    if after_id is not None:
+        conditions.append('(id > %s OR verified_at > %s)')
+        params.extend([after_id, verified_after])
+    
+    cursor.execute(f'''
+        SELECT latitude, longitude, EXTRACT(EPOCH FROM created_at), id, verified_at
+        FROM marks
+        WHERE {' AND '.join(conditions)}
+    ''', params)
+    return cursor.fetchall()
+
+def fetch_aged_out_marks(cursor, mark_type: str, previous_start: float, window_start: float, max_id: int, max_verified_at: Optional[Any]) -> list:
+    # Метки, уже учтенные в сетке (не новее max_id/max_verified_at), которые с прошлого расчета вышли за начало окна
+    conditions, params = marks_conditions(mark_type, previous_start)
+    conditions.extend([
+        "created_at < to_timestamp(%s) AT TIME ZONE 'UTC'",
+        'id <= %s',
+        '(verified_at IS NULL OR verified_at <= %s)'
+    ])
+    params.extend([window_start, max_id, max_verified_at])
+    
+    cursor.execute(f'''
+        SELECT latitude, longitude, EXTRACT(EPOCH FROM created_at), id, verified_at
+        FROM marks
+        WHERE {' AND '.join(conditions)}
+    ''', params)
+    return cursor.fetchall()
+
+def count_marks(cursor, mark_type: str, window_start: float) -> int:
+    conditions, params = marks_conditions(mark_type, window_start)
+    cursor.execute(f"SELECT COUNT(*) FROM marks WHERE {' AND '.join(conditions)}", params)
+    return cursor.fetchone()[0]
+
+def db_epoch(cursor) -> float:
+    cursor.execute('SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP::timestamp)')
+    return float(cursor.fetchone()[0])
+
+@traced_phase('heatmap')
+def compute_heatmap(cursor, key: Tuple[str, int, int], version: int) -> Dict[str, Any]:
+    import numpy as np
+    
+    mark_type, window_days, resolution = key
+    now = db_epoch(cursor)
+    window_start = now - window_days * 86400
+    entry = _heatmap_cache.get(key)
+    
+    # Инкрементально: добавить новые и заново проверенные метки и вычесть вышедшие из окна;
+    # если итоговое число меток не сходится с базой (снятие проверки, удаление), сетка строится заново
+    incremental = entry is not None and time.monotonic() - entry['computed_at'] < FULL_RECOMPUTE_INTERVAL
+    if incremental:
+        rows = fetch_marks(cursor, mark_type, window_start, entry['max_id'], entry['max_verified_at'])
+        aged_out = fetch_aged_out_marks(cursor, mark_type, entry['window_start'], window_start, entry['max_id'], entry['max_verified_at'])
+        count = entry['count'] - len(aged_out) + len(rows)
+        incremental = count == count_marks(cursor, mark_type, window_start)
+    
+    if incremental:
+        grid = entry['grid'] * np.exp2(-(now - entry['reference_time']) / 86400.0 / HALF_LIFE_DAYS)
+        bin_marks(grid, aged_out, now, sign=-1.0)
+        np.maximum(grid, 0, out=grid)
+        computed_at = entry['computed_at']
+    else:
+        rows = fetch_marks(cursor, mark_type, window_start)
+        height = int((REGION_LAT[1] - REGION_LAT[0]) * resolution)
+        width = int((REGION_LNG[1] - REGION_LNG[0]) * resolution)
+        grid = np.zeros((height, width), dtype=np.float64)
+        count = len(rows)
+        computed_at = time.monotonic()
+        entry = {'max_id': 0, 'max_verified_at': None}
+    
+    bin_marks(grid, rows, now)
+    
+    density = smooth(grid, SMOOTHING_SIGMA)[::-1]
+    peak = float(density.max()) if density.size else 0.0
+    pixels = np.zeros(density.shape, dtype=np.uint8) if peak <= 0 else np.round(density / peak * 255).astype(np.uint8)
+    
+    verified_values = [row[4] for row in rows if row[4] is not None]
+    if entry['max_verified_at'] is not None:
+        verified_values.append(entry['max_verified_at'])
+    
+    new_entry = {
+        'version': version,
+        'grid': grid,
+        'reference_time': now,
+        'window_start': window_start,
+        'computed_at': computed_at,
+        'refreshed_at': time.monotonic(),
+        'count': count,
+        'max_id': max([entry['max_id']] + [row[3] for row in rows]),
+        'max_verified_at': max(verified_values) if verified_values else None,
+        'pixels': pixels,
+        'peak': peak
+    }
+    
+    _heatmap_cache[key] = new_entry
+    _heatmap_cache.move_to_end(key)
+    while len(_heatmap_cache) > HEATMAP_CACHE_MAX_ENTRIES:
+        _heatmap_cache.popitem(last=False)
+    
+    return new_entry
+
+@traced_phase('png')
+def encode_png(pixels: 'np.ndarray') -> bytes:
+    import numpy as np
+    
+    height, width = pixels.shape
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+    
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw, 9))
+        + chunk(b'IEND', b'')
+    )
+
+@traced('heatmap')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Карта плотности проверенных меток с затуханием по давности
+    Args: event - HTTP запрос с параметрами type, days, resolution, format
+          context - контекст выполнения функции
+    Returns: PNG в оттенках серого или JSON с квантованной сеткой плотности
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if method != 'GET':
+        return method_not_allowed_response()
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        mark_type = query_params.get('type', 'all')
+        window_days = int(query_params.get('days', DEFAULT_WINDOW_DAYS))
+        resolution = int(query_params.get('resolution', DEFAULT_RESOLUTION))
+        output_format = query_params.get('format', 'json')
+        
+        if mark_type not in ('all', 'tick', 'hogweed'):
+            raise ValueError('Некорректный тип')
+        if window_days < 1 or window_days > MAX_WINDOW_DAYS or resolution not in RESOLUTIONS:
+            raise ValueError('Некорректный период или разрешение')
+        if output_format not in ('json', 'png'):
+            raise ValueError('Некорректный формат')
+    except ValueError:
+        return bad_request_response()
+    
+    key = (mark_type, window_days, resolution)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        version = get_data_version(cursor, 'marks')
+        
+        entry = _heatmap_cache.get(key)
+        if entry is None or entry['version'] != version or time.monotonic() - entry['refreshed_at'] > DECAY_REFRESH_INTERVAL:
+            entry = compute_heatmap(cursor, key, version)
+        else:
+            _heatmap_cache.move_to_end(key)
+        
+        etag = build_etag('heatmap', f"{version}-{int(entry['reference_time'])}", query_params)
+        cache_headers = {**headers, 'ETag': etag, 'Cache-Control': PUBLIC_CACHE_CONTROL}
+        
+        if is_not_modified(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': cache_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        if output_format == 'png':
+            return {
+                'statusCode': 200,
+                'headers': {**cache_headers, 'Content-Type': 'image/png'},
+                'body': base64.b64encode(encode_png(entry['pixels'])).decode('ascii'),
+                'isBase64Encoded': True
+            }
+        
+        height, width = entry['pixels'].shape
+        return {
+            'statusCode': 200,
+            'headers': cache_headers,
+            'body': json.dumps({
+                'bounds': {'south': REGION_LAT[0], 'north': REGION_LAT[1], 'west': REGION_LNG[0], 'east': REGION_LNG[1]},
+                'width': width,
+                'height': height,
+                'peak': entry['peak'],
+                'marksCount': entry['count'],
+                'data': base64.b64encode(entry['pixels'].tobytes()).decode('ascii')
+            }),
+            'isBase64Encoded': False
+        }
+    
+    finally:
+        cursor.close()
+        release_db_connection(conn)
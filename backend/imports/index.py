@@ -0,0 +1,290 @@
+import base64
+import csv
+import io
+import json
+import time
+import psycopg2
+from datetime import date, datetime
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from function_runtime import (
+    JSON_HEADERS, bad_request_response, error_response, get_admin_token, get_db_connection,
+    method_not_allowed_response, preflight_headers, release_db_connection, require_admin,
+    traced, traced_phase
+)
+
+# Границы совпадают с ограничением valid_coordinates таблицы marks
+MIN_LATITUDE = 54.0
+MAX_LATITUDE = 57.0
+MIN_LONGITUDE = 35.0
+MAX_LONGITUDE = 40.0
+
+IMPORT_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 50
+IMPORT_FORMATS = ('csv', 'geojson')
+MARK_TYPES = ('tick', 'hogweed')
+TREATMENT_STATUSES = ('active', 'completed', 'cancelled')
+DEFAULT_ZONE_COLOR = '#3b82f6'
+
+IMPORT_TARGETS = {
+    'marks': ('marks', ('type', 'latitude', 'longitude', 'verified', 'user_ip', 'user_agent', 'created_at', 'verified_at', 'verified_by', 'description')),
+    'planned': ('planned_treatments', ('type', 'area_name', 'planned_date', 'coordinates', 'color', 'created_by')),
+    'current': ('current_treatments', ('type', 'area_name', 'start_date', 'end_date', 'coordinates', 'status', 'created_by'))
+}
+
+FIELD_ALIASES = {
+    'lat': 'latitude',
+    'lon': 'longitude',
+    'lng': 'longitude',
+    'created_at': 'date',
+    'area_name': 'area',
+    'planned_date': 'date',
+    'start_date': 'startDate',
+    'end_date': 'endDate'
+}
+
+PREFLIGHT_HEADERS = preflight_headers('POST, OPTIONS')
+
+def normalize_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for key, value in fields.items():
+        if not isinstance(key, str):
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ''):
+            key = key.strip()
+            normalized[FIELD_ALIASES.get(key, key)] = value
+    return normalized
+
+def read_records(content: str, data_format: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    if data_format == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        for fields in reader:
+            yield reader.line_num, normalize_fields(fields)
+        return
+    
+    collection = json.loads(content)
+    features = collection.get('features') if isinstance(collection, dict) else None
+    if not isinstance(features, list):
+        raise ValueError('Ожидается GeoJSON FeatureCollection')
+    
+    for number, feature in enumerate(features, start=1):
+        feature = feature if isinstance(feature, dict) else {}
+        fields = normalize_fields(feature.get('properties') or {})
+        fields['geometry'] = feature.get('geometry')
+        yield number, fields
+
+def check_bounds(lat: float, lng: float):
+    if not (MIN_LATITUDE <= lat <= MAX_LATITUDE and MIN_LONGITUDE <= lng <= MAX_LONGITUDE):
+        raise ValueError(f'Координаты {lat}, {lng} вне Москвы и Московской области')
+
+def parse_location(fields: Dict[str, Any]) -> Tuple[float, float, Optional[List[List[float]]]]:
+    geometry = fields.get('geometry')
+    if geometry is None:
+        lat = float(fields['latitude'])
+        lng = float(fields['longitude'])
+        check_bounds(lat, lng)
+        return lat, lng, None
+    
+    if geometry.get('type') == 'Point':
+        lng, lat = (float(value) for value in geometry['coordinates'][:2])
+        check_bounds(lat, lng)
+        return lat, lng, None
+    
+    if geometry.get('type') == 'Polygon':
+        ring = [[float(point[0]), float(point[1])] for point in geometry['coordinates'][0]]
+        if len(ring) < 4 or ring[0] != ring[-1]:
+            raise ValueError('Полигон должен быть замкнутым и содержать не менее 3 вершин')
+        for lng, lat in ring:
+            check_bounds(lat, lng)
+        vertices = ring[:-1]
+        return sum(p[1] for p in vertices) / len(vertices), sum(p[0] for p in vertices) / len(vertices), ring
+    
+    raise ValueError('Поддерживаются только геометрии Point и Polygon')
+
+def parse_flag(value: Any, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', '1', 'yes', 'да'):
+        return True
+    if str(value).lower() in ('false', '0', 'no', 'нет'):
+        return False
+    raise ValueError(f'Некорректное логическое значение: {value}')
+
+def build_row(target: str, fields: Dict[str, Any], admin_token: str, verified_default: bool, now: datetime) -> Tuple[Any, ...]:
+    mark_type = fields.get('type')
+    if mark_type not in MARK_TYPES:
+        raise ValueError(f'Неизвестный тип: {mark_type}')
+    
+    lat, lng, polygon = parse_location(fields)
+    
+    if target == 'marks':
+        created_at = datetime.fromisoformat(str(fields['date'])) if 'date' in fields else now
+        verified = parse_flag(fields.get('verified'), verified_default)
+        return (
+            mark_type, lat, lng, verified, 'import', 'bulk-import', created_at,
+            now if verified else None, admin_token if verified else None, fields.get('description')
+        )
+    
+    if 'area' not in fields:
+        raise ValueError('Не указано название участка')
+    
+    coordinates = {'lat': lat, 'lng': lng}
+    if polygon:
+        coordinates['polygon'] = polygon
+    
+    if target == 'planned':
+        planned_date = date.fromisoformat(str(fields['date']))
+        return (mark_type, fields['area'], planned_date, json.dumps(coordinates), fields.get('color', DEFAULT_ZONE_COLOR), admin_token)
+    
+    start_date = date.fromisoformat(str(fields['startDate']))
+    end_date = date.fromisoformat(str(fields['endDate']))
+    if end_date < start_date:
+        raise ValueError('Дата окончания раньше даты начала')
+    status = fields.get('status', 'active')
+    if status not in TREATMENT_STATUSES:
+        raise ValueError(f'Неизвестный статус: {status}')
+    
+    return (mark_type, fields['area'], start_date, end_date, json.dumps(coordinates), status, admin_token)
+
+@traced_phase('validate')
+def validate_records(target: str, records: Iterator[Tuple[int, Dict[str, Any]]], admin_token: str, verified_default: bool) -> Tuple[List[Tuple[Any, ...]], List[Dict[str, Any]], int]:
+    rows = []
+    errors = []
+    invalid_count = 0
+    now = datetime.now()
+    
+    for number, fields in records:
+        try:
+            rows.append(build_row(target, fields, admin_token, verified_default, now))
+        except (KeyError, ValueError, TypeError, AttributeError, IndexError) as error:
+            invalid_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                message = f'Не указано поле {error}' if isinstance(error, KeyError) else str(error)
+                errors.append({'row': number, 'error': message})
+    
+    return rows, errors, invalid_count
+
+def copy_rows(cursor, table_name: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table_name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+class ImportInterrupted(Exception):
+    def __init__(self, imported: int, error: Exception):
+        super().__init__(str(error))
+        self.imported = imported
+
+def import_rows(conn, target: str, rows: List[Tuple[Any, ...]], progress: Optional[Callable[[int, int], None]] = None) -> int:
+    # Каждый блок коммитится отдельно: блокировка журнала изменений меток и строка data_versions
+    # удерживаются на время одного COPY, а не всего файла, и запись меток не ждёт конца импорта.
+    # При ошибке загруженные блоки остаются, ImportInterrupted сообщает, со строки какого номера продолжить
+    table_name, columns = IMPORT_TARGETS[target]
+    imported = 0
+    with conn.cursor() as cursor:
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+            try:
+                copy_rows(cursor, table_name, columns, chunk)
+                conn.commit()
+            except psycopg2.Error as error:
+                conn.rollback()
+                raise ImportInterrupted(imported, error)
+            imported += len(chunk)
+            if progress:
+                progress(imported, len(rows))
+    return imported
+
+@traced('imports')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Массовый импорт меток и обработок из CSV или GeoJSON для администраторов
+    Args: event - HTTP запрос с файлом в теле и параметрами target, format, verified
+          context - контекст выполнения функции
+    Returns: JSON с числом загруженных строк или списком ошибок проверки
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if method != 'POST':
+        return method_not_allowed_response()
+    
+    denied = require_admin(event)
+    if denied:
+        return denied
+    admin_token = get_admin_token(event)
+    
+    query_params = event.get('queryStringParameters') or {}
+    content = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        content = base64.b64decode(content).decode('utf-8')
+    content = content.lstrip('\ufeff')
+    
+    target = query_params.get('target', 'marks')
+    data_format = query_params.get('format') or ('geojson' if content.lstrip().startswith('{') else 'csv')
+    
+    try:
+        if target not in IMPORT_TARGETS or data_format not in IMPORT_FORMATS:
+            raise ValueError('Неизвестный тип данных или формат')
+        verified_default = parse_flag(query_params.get('verified'), True)
+        rows, errors, invalid_count = validate_records(target, read_records(content, data_format), admin_token, verified_default)
+    except (ValueError, csv.Error):
+        return bad_request_response('Некорректные параметры запроса или файл')
+    
+    if invalid_count:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Данные не прошли проверку', 'invalidRows': invalid_count, 'errors': errors}),
+            'isBase64Encoded': False
+        }
+    
+    # skip - число уже загруженных строк после прерванного импорта того же файла
+    try:
+        skip = int(query_params.get('skip', 0))
+        if skip < 0:
+            raise ValueError
+    except ValueError:
+        return bad_request_response('skip должен быть неотрицательным целым числом')
+    rows = rows[skip:]
+    
+    if not rows:
+        return bad_request_response('Нет данных для импорта')
+    
+    started = time.monotonic()
+    conn = get_db_connection()
+    try:
+        imported = import_rows(conn, target, rows)
+    except ImportInterrupted as error:
+        return error_response(500, {
+            'error': 'Импорт прерван, загруженные блоки сохранены',
+            'imported': error.imported,
+            'resumeSkip': skip + error.imported
+        })
+    finally:
+        release_db_connection(conn)
+    
+    return {
+        'statusCode': 201,
+        'headers': headers,
+        'body': json.dumps({
+            'success': True,
+            'target': target,
+            'imported': imported,
+            'chunks': -(-imported // IMPORT_CHUNK_SIZE),
+            'durationMs': round((time.monotonic() - started) * 1000)
+        }),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,482 @@
+'''
+Общий код облачных функций: пул соединений, трассировка запросов, типовые ответы,
+проверка администратора, разбор параметров, слои карты, ETag и кэш ответов.
+Исходник лежит в shared/, а в каждую функцию backend/<name>/ копируется скриптом
+scripts/sync_shared.py: функции разворачиваются отдельными пакетами, поэтому копии
+хранятся в репозитории, но правятся только здесь.
+'''
+import base64
+import binascii
+import functools
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import psycopg2
+from psycopg2 import pool
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+DB_HEALTHCHECK_INTERVAL = 30
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+ADMIN_TOKENS = ('SergSyn', 'IvanGesh')
+RATE_LIMIT_CLEANUP_PROBABILITY = 0.01
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED') == 'true'
+TRACE_MAX_STATEMENTS = 20
+
+_trace = threading.local()
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_last_used: Dict[int, float] = {}
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+
+class PoolTimeout(psycopg2.OperationalError):
+    # Все соединения пула заняты дольше DB_POOL_ACQUIRE_TIMEOUT; traced отвечает на нее 503
+    pass
+
+class TracingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_statement(query, started, self.rowcount)
+    
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_statement(query, started, self.rowcount)
+    
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_statement(sql, started, self.rowcount)
+
+def record_statement(query: Any, started: float, rowcount: int):
+    trace = getattr(_trace, 'current', None)
+    if trace is None:
+        return
+    
+    duration = (time.perf_counter() - started) * 1000
+    trace['spans']['db'] = trace['spans'].get('db', 0) + duration
+    trace['queries'] += 1
+    trace['rows'] += max(rowcount, 0)
+    if len(trace['statements']) < TRACE_MAX_STATEMENTS:
+        sql = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+        trace['statements'].append({'sql': ' '.join(sql.split())[:120], 'ms': round(duration, 2), 'rows': rowcount})
+
+@contextmanager
+def trace_span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = getattr(_trace, 'current', None)
+        if trace is not None:
+            trace['spans'][name] = trace['spans'].get(name, 0) + (time.perf_counter() - started) * 1000
+
+def traced_phase(name: str):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced(function_name: str):
+    # Одна строка JSON в лог на запрос; при SERVER_TIMING_ENABLED=true фазы дублируются в заголовке Server-Timing
+    def decorator(handler_function):
+        @functools.wraps(handler_function)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            _trace.current = {'spans': {}, 'queries': 0, 'rows': 0, 'statements': []}
+            started = time.perf_counter()
+            result = None
+            try:
+                result = handler_function(event, context)
+                return result
+            except PoolTimeout:
+                result = error_response(503, {'error': 'Сервис перегружен, повторите запрос позже'}, {**JSON_HEADERS, 'Retry-After': '1'})
+                return result
+            finally:
+                trace = _trace.current
+                _trace.current = None
+                total = (time.perf_counter() - started) * 1000
+                spans = {name: round(value, 2) for name, value in trace['spans'].items()}
+                print(json.dumps({
+                    'function': function_name,
+                    'method': event.get('httpMethod'),
+                    'status': result.get('statusCode') if result else 500,
+                    'duration_ms': round(total, 2),
+                    'spans': spans,
+                    'queries': trace['queries'],
+                    'rows': trace['rows'],
+                    'response_bytes': len(result.get('body') or '') if result else 0,
+                    'statements': trace['statements']
+                }, ensure_ascii=False), flush=True)
+                
+                if result is not None and SERVER_TIMING_ENABLED:
+                    timings = [f'{name};dur={value}' for name, value in spans.items()]
+                    timings.append(f'total;dur={round(total, 2)};desc="{trace["queries"]} queries"')
+                    result['headers'] = {
+                        **(result.get('headers') or {}),
+                        'Server-Timing': ', '.join(timings),
+                        'Timing-Allow-Origin': '*'
+                    }
+        return wrapper
+    return decorator
+
+def get_db_pool() -> pool.ThreadedConnectionPool:
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ.get('DATABASE_URL'), cursor_factory=TracingCursor)
+    return _db_pool
+
+@traced_phase('connect')
+def get_db_connection():
+    # Потоки ждут свободное соединение, а не получают PoolError при исчерпании пула, но не дольше таймаута
+    if not _db_pool_slots.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT):
+        raise PoolTimeout('Нет свободных соединений с базой данных')
+    
+    # Слот возвращается при любой ошибке, иначе после сбоя подключения пул постепенно «закрывается» для всех потоков
+    try:
+        db_pool = get_db_pool()
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = db_pool.getconn()
+            last_used = _db_last_used.get(id(conn))
+            if not conn.closed and (last_used is None or time.monotonic() - last_used < DB_HEALTHCHECK_INTERVAL):
+                return conn
+            
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg2.Error:
+                _db_last_used.pop(id(conn), None)
+                db_pool.putconn(conn, close=True)
+        
+        raise psycopg2.OperationalError('Не удалось получить соединение с базой данных')
+    except BaseException:
+        _db_pool_slots.release()
+        raise
+
+def release_db_connection(conn):
+    try:
+        if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        pass
+    
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        _db_pool.putconn(conn, close=True)
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+        _db_pool.putconn(conn)
+    _db_pool_slots.release()
+
+def preflight_headers(methods: str) -> Dict[str, str]:
+    return {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': methods,
+        'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+        'Access-Control-Max-Age': '86400'
+    }
+
+def error_response(status_code: int, body: Dict[str, Any], headers: Dict[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+def bad_request_response(message: str = 'Некорректные параметры запроса', headers: Dict[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return error_response(400, {'error': message}, headers)
+
+def forbidden_response(message: str = 'Требуется авторизация администратора', headers: Dict[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return error_response(403, {'error': message}, headers)
+
+def method_not_allowed_response(headers: Dict[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return error_response(405, {'error': 'Метод не поддерживается'}, headers)
+
+def get_admin_token(event: Dict[str, Any]) -> str:
+    return (event.get('headers') or {}).get('x-admin-token', '')
+
+def is_admin_token(token: str) -> bool:
+    return token in ADMIN_TOKENS
+
+def require_admin(event: Dict[str, Any], headers: Dict[str, str] = JSON_HEADERS) -> Optional[Dict[str, Any]]:
+    # None - доступ разрешен, иначе готовый ответ 403
+    if is_admin_token(get_admin_token(event)):
+        return None
+    return forbidden_response(headers=headers)
+
+def get_client_ip(event: Dict[str, Any]) -> str:
+    return ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp', 'unknown')
+
+def check_rate_limit(cursor, user_ip: str, action_type: str, capacity: float, refill_per_second: float) -> bool:
+    # Token bucket на строку rate_limits: до capacity действий подряд, затем refill_per_second действий в секунду.
+    # Один атомарный UPSERT, поэтому параллельные запросы с одного адреса не проскакивают мимо лимита
+    cursor.execute('''
+        INSERT INTO rate_limits (user_ip, action_type, action_count, tokens, last_action)
+        VALUES (%(user_ip)s, %(action_type)s, 1, %(capacity)s - 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_ip, action_type) DO UPDATE SET
+            tokens = GREATEST(
+                LEAST(
+                    %(capacity)s,
+                    COALESCE(rate_limits.tokens, %(capacity)s)
+                        + EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - rate_limits.last_action)) * %(refill)s
+                ) - 1,
+                -1
+            ),
+            action_count = rate_limits.action_count + 1,
+            last_action = CURRENT_TIMESTAMP
+        RETURNING tokens
+    ''', {'user_ip': user_ip, 'action_type': action_type, 'capacity': capacity, 'refill': refill_per_second})
+    
+    allowed = cursor.fetchone()[0] >= 0
+    
+    # Строка, не менявшаяся дольше полного пополнения корзины, ничем не отличается от отсутствующей
+    if allowed and random.random() < RATE_LIMIT_CLEANUP_PROBABILITY:
+        cursor.execute('''
+            DELETE FROM rate_limits
+            WHERE action_type = %s AND last_action < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+        ''', (action_type, capacity / refill_per_second))
+    
+    return allowed
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError('bbox должен содержать 4 числа')
+    
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in parts)
+    if not all(math.isfinite(v) for v in (min_lng, min_lat, max_lng, max_lat)):
+        raise ValueError('bbox содержит нечисловые значения')
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError('Некорректные границы bbox')
+    
+    return min_lng, min_lat, max_lng, max_lat
+
+def parse_limit(value: Optional[str], default: int, maximum: int) -> int:
+    limit = int(value) if value is not None else default
+    if limit < 1 or limit > maximum:
+        raise ValueError('limit вне допустимого диапазона')
+    
+    return limit
+
+def encode_cursor(created_at: Optional[datetime], row_id: int) -> str:
+    # Для записи без created_at дата в курсоре пустая
+    raw = f"{created_at.isoformat() if created_at else ''}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(value: str) -> Tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+        created_at, row_id = raw.split('|')
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('Некорректный курсор') from e
+
+def keyset_condition(after: Tuple[Optional[datetime], int]) -> Tuple[str, List[Any]]:
+    # ORDER BY created_at DESC ставит записи без даты первыми (NULLS FIRST), а сравнение строк с NULL их отбрасывает:
+    # после такой записи идут оставшиеся записи без даты и все датированные
+    created_at, row_id = after
+    if created_at is None:
+        return '((created_at IS NULL AND id < %s) OR created_at IS NOT NULL)', [row_id]
+    return '(created_at, id) < (%s, %s)', [created_at, row_id]
+
+def mark_json_sql(alias: str = '', extra: str = '') -> str:
+    # extra - дополнительные пары ключ/выражение через запятую, например ", 'count', cell_count"
+    prefix = f'{alias}.' if alias else ''
+    return f'''json_build_object(
+        'id', {prefix}id, 'type', {prefix}type, 'lat', {prefix}latitude::float8, 'lng', {prefix}longitude::float8,
+        'verified', {prefix}verified, 'date', {prefix}created_at, 'description', {prefix}description,
+        'reports', {prefix}report_count{extra}
+    )'''
+
+# Слои карты в формате ответов API. Строки собирает сам Postgres (json_build_object), поэтому отдельные
+# функции и bootstrap отдают один и тот же JSON, а bootstrap читает все слои одним оператором
+MAP_LAYERS: Dict[str, Dict[str, Any]] = {
+    'marks': {
+        'table': 'marks',
+        'row': mark_json_sql(),
+        'conditions': [],
+        'order': 'created_at DESC, id DESC'
+    },
+    'planned': {
+        'table': 'planned_treatments',
+        'row': '''json_build_object(
+            'id', id, 'type', type, 'area', area_name, 'date', planned_date, 'coordinates', coordinates,
+            'color', color, 'createdBy', created_by
+        )''',
+        'conditions': [],
+        'order': 'planned_date ASC'
+    },
+    'current': {
+        'table': 'current_treatments',
+        'row': '''json_build_object(
+            'id', id, 'type', type, 'area', area_name, 'startDate', start_date, 'endDate', end_date,
+            'coordinates', coordinates, 'status', status, 'createdBy', created_by
+        )''',
+        'conditions': ["status = 'active'"],
+        'order': 'start_date DESC'
+    },
+    'news': {
+        'table': 'news',
+        'row': '''json_build_object(
+            'id', id, 'title', title, 'content', content, 'author', author, 'date', created_at,
+            'imageUrl', image_url
+        )''',
+        'conditions': ['published = true'],
+        'order': 'created_at DESC, id DESC'
+    }
+}
+
+def map_layer_rows_sql(
+    layer: str, conditions: Optional[List[str]] = None, columns: str = '', limit: bool = False, as_text: bool = True
+) -> str:
+    # Строки слоя по одной: первая колонка - JSON строки (текстом, если as_text), дальше columns (например, ключ курсора)
+    spec = MAP_LAYERS[layer]
+    where = spec['conditions'] + (conditions or [])
+    return f'''
+        SELECT {spec['row']}{'::text' if as_text else ''}{', ' + columns if columns else ''}
+        FROM {spec['table']}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {spec['order']}
+        {'LIMIT %s' if limit else ''}
+    '''
+
+def map_layer_sql(layer: str, conditions: Optional[List[str]] = None) -> str:
+    # Весь слой JSON-массивом в одном значении; json_agg сохраняет порядок отсортированного подзапроса,
+    # а подзапрос, в отличие от json_agg(... ORDER BY), может читать строки по индексу без отдельной сортировки
+    return f'''(
+        SELECT COALESCE(json_agg(layer_rows.row_json), '[]')::text
+        FROM ({map_layer_rows_sql(layer, conditions, as_text=False)}) AS layer_rows(row_json)
+    )'''
+
+# Горизонт не меньше любого удаленного очисткой seq, поэтому номер не уменьшается, даже если журнал опустел
+LATEST_CHANGE_SEQ_SQL = '''(
+    SELECT GREATEST(COALESCE(MAX(seq), 0), (SELECT seq FROM marks_changes_horizon)) FROM marks_changes
+)'''
+
+def get_latest_change_seq(cursor) -> int:
+    cursor.execute(f'SELECT {LATEST_CHANGE_SEQ_SQL}')
+    return cursor.fetchone()[0]
+
+def fetch_json_fragments(cursor, fragments: Dict[str, str]) -> Dict[str, str]:
+    # Несколько подзапросов одним оператором: один обход сети и один снимок данных для всех значений
+    cursor.execute('SELECT ' + ', '.join(f'({sql})::text' for sql in fragments.values()))
+    return dict(zip(fragments, cursor.fetchone()))
+
+def json_object_text(fragments: Dict[str, str]) -> str:
+    # Объект из готовых JSON-фрагментов без повторного разбора и сериализации
+    return '{' + ', '.join(f'{json.dumps(key)}: {value}' for key, value in fragments.items()) + '}'
+
+def get_data_version(cursor, table_name: str) -> int:
+    cursor.execute('SELECT version FROM data_versions WHERE table_name = %s', (table_name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def build_etag(table_name: str, version: Union[int, str], query_params: Dict[str, Any]) -> str:
+    params_hash = hashlib.md5(json.dumps(query_params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f'W/"{table_name}-{version}-{params_hash}"'
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    if_none_match = (event.get('headers') or {}).get('if-none-match', '')
+    return etag in [tag.strip() for tag in if_none_match.split(',')]
+
+def accepts_gzip(event: Dict[str, Any]) -> bool:
+    return 'gzip' in (event.get('headers') or {}).get('accept-encoding', '')
+
+class ResponseCache(OrderedDict):
+    # Готовые ответы по ключу запроса; запись действительна, пока не изменилась версия данных
+    def __init__(self, max_entries: int, ttl: float, gzip_min_size: Optional[int] = None, base64_body: bool = False):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.gzip_min_size = gzip_min_size
+        self.base64_body = base64_body
+    
+    def lookup(self, key: str, version: Optional[Union[int, str]] = None) -> Optional[Dict[str, Any]]:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        
+        if version is None:
+            if entry['expires_at'] < time.monotonic():
+                return None
+        elif entry['version'] == version:
+            entry['expires_at'] = time.monotonic() + self.ttl
+        else:
+            return None
+        
+        self.move_to_end(key)
+        return entry
+    
+    def store(self, key: str, version: Union[int, str], headers: Dict[str, str], body: str) -> Dict[str, Any]:
+        entry = {
+            'version': version,
+            'headers': headers,
+            'body': body,
+            'expires_at': time.monotonic() + self.ttl,
+            'gzip_min_size': self.gzip_min_size,
+            'isBase64Encoded': self.base64_body
+        }
+        self[key] = entry
+        self.move_to_end(key)
+        while len(self) > self.max_entries:
+            self.popitem(last=False)
+        return entry
+
+def cached_response(entry: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    if is_not_modified(event, entry['headers']['ETag']):
+        return {
+            'statusCode': 304,
+            'headers': dict(entry['headers']),
+            'body': '',
+            'isBase64Encoded': entry['isBase64Encoded']
+        }
+    
+    gzip_min_size = entry['gzip_min_size']
+    if gzip_min_size is not None and len(entry['body']) >= gzip_min_size and accepts_gzip(event):
+        if 'gzip_body' not in entry:
+            with trace_span('gzip'):
+                compressed = gzip.compress(entry['body'].encode('utf-8'), compresslevel=6, mtime=0)
+            entry['gzip_body'] = base64.b64encode(compressed).decode('ascii')
+        return {
+            'statusCode': 200,
+            'headers': {**entry['headers'], 'Content-Encoding': 'gzip'},
+            'body': entry['gzip_body'],
+            'isBase64Encoded': True
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': dict(entry['headers']),
+        'body': entry['body'],
+        'isBase64Encoded': entry['isBase64Encoded']
+    }
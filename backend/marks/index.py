@@ -1,39 +1,338 @@
 import json
+import math
 import os
+import random
+import select
+import threading
+import time
 import psycopg2
-import requests
-from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+from function_runtime import (
+    JSON_HEADERS, LATEST_CHANGE_SEQ_SQL, ResponseCache, bad_request_response, build_etag,
+    cached_response, check_rate_limit, decode_cursor, encode_cursor, error_response,
+    get_admin_token, get_client_ip, get_data_version, get_db_connection, get_latest_change_seq,
+    is_not_modified, json_object_text, keyset_condition, mark_json_sql,
+    method_not_allowed_response, parse_bbox, parse_limit, preflight_headers,
+    release_db_connection, require_admin, trace_span, traced
+)
 
-def send_telegram_notification(mark_type: str, latitude: float, longitude: float, description: str):
+MIN_ZOOM = 0
+MAX_ZOOM = 21
+CLUSTER_CELLS_PER_TILE = 4
+THINNING_MAX_ZOOM = 13
+THINNING_CELL_PIXELS = 8
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=30, stale-while-revalidate=300'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 128
+GZIP_MIN_SIZE = 1024
+OUTPUT_FORMATS = ('json', 'columnar')
+CHANGES_PAGE_SIZE = 1000
+CHANGES_CHANNEL = 'marks_changes'
+LONG_POLL_MAX_WAIT = 25
+CHANGES_RETENTION_DAYS = 30
+CHANGES_COMPACTION_BATCH = 5000
+CHANGES_COMPACTION_PROBABILITY = 0.01
+LISTEN_KEEPALIVE_INTERVAL = 30
+
+BULK_MAX_IDS = 1000
+BULK_FILTER_STATUSES = {'pending': 'verified = false', 'verified': 'verified = true'}
+
+DEDUP_RADIUS_METERS = float(os.environ.get('DEDUP_RADIUS_METERS', '50'))
+DEDUP_WINDOW_HOURS = float(os.environ.get('DEDUP_WINDOW_HOURS', '72'))
+METERS_PER_DEGREE = 111320
+
+RATE_LIMIT_MARKS_PER_HOUR = 5
+
+PREFLIGHT_HEADERS = preflight_headers('GET, POST, PUT, DELETE, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, gzip_min_size=GZIP_MIN_SIZE)
+_change_listener = None
+_change_listener_lock = threading.Lock()
+
+def parse_zoom(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    
+    zoom = int(value)
+    if zoom < MIN_ZOOM or zoom > MAX_ZOOM:
+        raise ValueError('zoom вне допустимого диапазона')
+    
+    return zoom
+
+def cluster_cell_size(zoom: int) -> float:
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+def thinning_cell_size(zoom: int) -> Optional[float]:
+    # На мелком масштабе метки ближе THINNING_CELL_PIXELS пикселей сливаются в одну точку, из такой ячейки отдается самая новая метка каждого типа и статуса проверки;
+    # начиная с THINNING_MAX_ZOOM + 1 видны все метки
+    if zoom > THINNING_MAX_ZOOM:
+        return None
+    return 360.0 / (2 ** zoom) / 256 * THINNING_CELL_PIXELS
+
+def fetch_changes(cursor, since: int, verified_only: bool) -> Dict[str, Any]:
+    # Изменённые метки - готовые JSON-строки от mark_json_sql, как в выдаче списка и bootstrap
+    cursor.execute(f'''
+        SELECT c.seq, c.mark_id, c.operation, m.verified, {mark_json_sql('m')}::text
+        FROM (
+            SELECT DISTINCT ON (mark_id) seq, mark_id, operation
+            FROM marks_changes
+            WHERE seq > %s
+            ORDER BY mark_id, seq DESC
+        ) c
+        LEFT JOIN marks m ON m.id = c.mark_id
+        ORDER BY c.seq
+        LIMIT %s
+    ''', (since, CHANGES_PAGE_SIZE + 1))
+    
+    rows = cursor.fetchall()
+    has_more = len(rows) > CHANGES_PAGE_SIZE
+    rows = rows[:CHANGES_PAGE_SIZE]
+    
+    # Горизонт читается после выборки: очистка, закончившаяся между запросами, даст лишний reset,
+    # но не потерянное удаление
+    cursor.execute(f'SELECT seq, {LATEST_CHANGE_SEQ_SQL} FROM marks_changes_horizon')
+    horizon, latest_known_seq = cursor.fetchone()
+    if since < horizon:
+        return {'reset': True, 'marks': [], 'deleted': [], 'seq': latest_known_seq, 'hasMore': False}
+    
+    changed = []
+    deleted = []
+    for row in rows:
+        if row[2] == 'delete' or row[3] is None or (verified_only and not row[3]):
+            deleted.append(row[1])
+            continue
+        changed.append(row[4])
+    
+    if rows:
+        latest_seq = rows[-1][0]
+    else:
+        latest_seq = max(since, latest_known_seq)
+    
+    return {'marks': changed, 'deleted': deleted, 'seq': latest_seq, 'hasMore': has_more}
+
+def compact_changes(conn, cursor):
+    # Журнал изменений чистится изредка после записи, как и rate_limits: перекрытые записи удаляются сразу,
+    # записи об удалении - через CHANGES_RETENTION_DAYS дней с подъемом горизонта журнала
+    if random.random() < CHANGES_COMPACTION_PROBABILITY:
+        cursor.execute('SELECT compact_marks_changes(%s, %s)', (CHANGES_RETENTION_DAYS, CHANGES_COMPACTION_BATCH))
+        conn.commit()
+
+def changes_body(changes: Dict[str, Any]) -> str:
+    fragments = {key: json.dumps(value) for key, value in changes.items()}
+    fragments['marks'] = '[' + ', '.join(changes['marks']) + ']'
+    return json_object_text(fragments)
+
+class ChangeListener:
+    # Одно соединение с LISTEN на процесс; каждое уведомление будит всех ожидающих клиентов
+    def __init__(self, dsn: str):
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        with self.conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANGES_CHANNEL}')
+        self.generation = 0
+        self.condition = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def run(self):
+        try:
+            while True:
+                if not select.select([self.conn], [], [], LISTEN_KEEPALIVE_INTERVAL)[0]:
+                    with self.conn.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                self.conn.poll()
+                if self.conn.notifies:
+                    self.conn.notifies.clear()
+                    self.wake()
+        except (psycopg2.Error, OSError):
+            pass
+        finally:
+            self.conn.close()
+            self.wake()
+    
+    def wake(self):
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+    
+    def wait(self, generation: int, timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.generation != generation, timeout)
+
+def get_change_listener() -> ChangeListener:
+    global _change_listener
+    listener = _change_listener
+    if listener is None or listener.conn.closed:
+        # Как и пул соединений: параллельные long-poll запросы не должны открыть несколько LISTEN-соединений
+        with _change_listener_lock:
+            if _change_listener is None or _change_listener.conn.closed:
+                _change_listener = ChangeListener(os.environ.get('DATABASE_URL'))
+            listener = _change_listener
+    return listener
+
+def long_poll_changes(query_params: Dict[str, str], headers: Dict[str, str]) -> Dict[str, Any]:
     try:
-        bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
-        chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+        since = int(query_params['since'])
+        wait = float(query_params['wait'])
+        if since < 0 or not 0 < wait <= LONG_POLL_MAX_WAIT:
+            raise ValueError('Некорректные параметры ожидания')
+    except (KeyError, ValueError):
+        return bad_request_response()
+    
+    verified_only = query_params.get('verified') == 'true'
+    deadline = time.monotonic() + wait
+    
+    while True:
+        listener = get_change_listener()
+        generation = listener.generation
         
-        if not bot_token or not chat_id:
-            return
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                changes = fetch_changes(cursor, since, verified_only)
+        finally:
+            release_db_connection(conn)
         
-        type_emoji = '🦂' if mark_type == 'tick' else '🌿'
-        type_text = 'Клещ' if mark_type == 'tick' else 'Борщевик'
+        remaining = deadline - time.monotonic()
+        if changes.get('reset') or changes['marks'] or changes['deleted'] or remaining <= 0:
+            break
         
-        message = f"""
-🔔 Новая метка!
+        listener.wait(generation, remaining)
+    
+    return {
+        'statusCode': 200,
+        'headers': {**headers, 'Cache-Control': 'no-store'},
+        'body': changes_body(changes),
+        'isBase64Encoded': False
+    }
 
-{type_emoji} Тип: {type_text}
-📍 Координаты: {latitude:.4f}, {longitude:.4f}
-📝 Описание: {description or 'не указано'}
+def parse_json_object(body: Optional[str]) -> Dict[str, Any]:
+    # Массив или строка в теле - ошибка клиента (400), а не AttributeError на .get()
+    data = json.loads(body or '{}')
+    if not isinstance(data, dict):
+        raise ValueError('Тело запроса должно быть JSON-объектом')
+    return data
 
-✅ Требуется проверка администратором
-        """
-        
-        requests.post(
-            f'https://api.telegram.org/bot{bot_token}/sendMessage',
-            json={'chat_id': chat_id, 'text': message},
-            timeout=5
+def parse_bulk_selection(body_data: Dict[str, Any]) -> Tuple[Optional[List[int]], str, List[Any]]:
+    if 'ids' in body_data:
+        ids = body_data['ids']
+        if not isinstance(ids, list) or not 0 < len(ids) <= BULK_MAX_IDS:
+            raise ValueError(f'ids должен содержать от 1 до {BULK_MAX_IDS} элементов')
+        if not all(isinstance(mark_id, int) and not isinstance(mark_id, bool) for mark_id in ids):
+            raise ValueError('ids должен содержать целые числа')
+        return list(dict.fromkeys(ids)), '', []
+    
+    selection = body_data.get('filter')
+    if not isinstance(selection, dict) or not selection:
+        raise ValueError('Нужен список ids или фильтр')
+    
+    conditions = []
+    params = []
+    for key, value in selection.items():
+        if key == 'status' and value in BULK_FILTER_STATUSES:
+            conditions.append(BULK_FILTER_STATUSES[value])
+        elif key == 'type' and value in ('tick', 'hogweed'):
+            conditions.append('type = %s')
+            params.append(value)
+        elif key == 'bbox' and isinstance(value, str):
+            conditions.append('point(longitude, latitude) <@ box(point(%s, %s), point(%s, %s))')
+            params.extend(parse_bbox(value))
+        else:
+            raise ValueError(f'Некорректный фильтр: {key}')
+    
+    return None, ' AND '.join(conditions), params
+
+def run_bulk_moderation(cursor, action_sql: str, action_params: List[Any], body_data: Dict[str, Any], done_status: str) -> List[Dict[str, Any]]:
+    ids, where_clause, where_params = parse_bulk_selection(body_data)
+    
+    if ids is None:
+        cursor.execute(f'{action_sql} WHERE {where_clause} RETURNING id', action_params + where_params)
+        return [{'id': row[0], 'status': done_status} for row in cursor.fetchall()]
+    
+    cursor.execute(f'''
+        WITH changed AS (
+            {action_sql} WHERE id = ANY(%s) RETURNING id
+        )
+        SELECT requested.id, changed.id IS NOT NULL
+        FROM unnest(%s::int[]) WITH ORDINALITY AS requested(id, position)
+        LEFT JOIN changed ON changed.id = requested.id
+        ORDER BY requested.position
+    ''', action_params + [ids, ids])
+    
+    return [{'id': row[0], 'status': done_status if row[1] else 'not_found'} for row in cursor.fetchall()]
+
+def bulk_response(results: List[Dict[str, Any]], headers: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'success': True,
+            'affected': sum(1 for result in results if result['status'] != 'not_found'),
+            'results': results
+        }),
+        'isBase64Encoded': False
+    }
+
+def merge_duplicate_mark(cursor, mark_type: str, latitude: Any, longitude: Any, description: str) -> Optional[Tuple[int, int, bool]]:
+    try:
+        lat = float(latitude)
+        lng = float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if DEDUP_RADIUS_METERS <= 0 or not (math.isfinite(lat) and math.isfinite(lng)):
+        return None
+    
+    # Квадрат вокруг точки отбирается по GiST-индексу idx_marks_point, затем проверяется точное расстояние
+    lng_scale = METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+    lat_delta = DEDUP_RADIUS_METERS / METERS_PER_DEGREE
+    lng_delta = DEDUP_RADIUS_METERS / lng_scale
+    
+    # Описание повторного сообщения дописывается к описанию метки с новой строки, если такого текста в нем еще нет
+    cursor.execute('''
+        WITH target AS (
+            SELECT id, description
+            FROM marks
+            WHERE type = %(type)s
+                AND point(longitude, latitude) <@ box(point(%(min_lng)s, %(min_lat)s), point(%(max_lng)s, %(max_lat)s))
+                AND COALESCE(last_reported_at, created_at) >= CURRENT_TIMESTAMP - make_interval(secs => %(window)s)
+                AND ((latitude::float8 - %(lat)s) * %(lat_scale)s) ^ 2 + ((longitude::float8 - %(lng)s) * %(lng_scale)s) ^ 2 <= %(radius)s ^ 2
+            ORDER BY ((latitude::float8 - %(lat)s) * %(lat_scale)s) ^ 2 + ((longitude::float8 - %(lng)s) * %(lng_scale)s) ^ 2
+            LIMIT 1
+            FOR UPDATE
         )
-    except Exception as e:
-        print(f'Ошибка отправки уведомления: {e}')
+        UPDATE marks m
+        SET 
+            report_count = m.report_count + 1,
+            last_reported_at = CURRENT_TIMESTAMP,
+            description = CASE
+                WHEN %(description)s = '' OR strpos(COALESCE(m.description, ''), %(description)s) > 0 THEN m.description
+                WHEN COALESCE(m.description, '') = '' THEN %(description)s
+                ELSE m.description || E'\n' || %(description)s
+            END
+        FROM target
+        WHERE m.id = target.id
+        RETURNING m.id, m.report_count, m.description IS DISTINCT FROM target.description
+    ''', {
+        'type': mark_type,
+        'min_lng': lng - lng_delta,
+        'min_lat': lat - lat_delta,
+        'max_lng': lng + lng_delta,
+        'max_lat': lat + lat_delta,
+        'window': DEDUP_WINDOW_HOURS * 3600,
+        'lat': lat,
+        'lat_scale': METERS_PER_DEGREE,
+        'lng': lng,
+        'lng_scale': lng_scale,
+        'radius': DEDUP_RADIUS_METERS,
+        'description': description.strip() if isinstance(description, str) else ''
+    })
+    
+    return cursor.fetchone()
 
+@traced('marks')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для работы с метками клещей и борщевика
@@ -46,63 +345,205 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': PREFLIGHT_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('wait'):
+        return long_poll_changes(event.get('queryStringParameters') or {}, JSON_HEADERS)
+    
+    if method == 'GET':
+        response_cache_key = json.dumps(event.get('queryStringParameters') or {}, sort_keys=True)
+        cached = _response_cache.lookup(response_cache_key)
+        if cached:
+            return cached_response(cached, event)
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
     
     try:
         if method == 'GET':
             query_params = event.get('queryStringParameters', {}) or {}
             verified_only = query_params.get('verified') == 'true'
+            clustered = query_params.get('cluster') == 'true'
+            
+            try:
+                bbox = parse_bbox(query_params['bbox']) if query_params.get('bbox') else None
+                zoom = parse_zoom(query_params.get('zoom'))
+                if clustered and zoom is None:
+                    raise ValueError('Для кластеризации нужен zoom')
+                
+                output_format = query_params.get('format', 'json')
+                if output_format not in OUTPUT_FORMATS:
+                    raise ValueError('Неизвестный формат ответа')
+                
+                since = int(query_params['since']) if 'since' in query_params else None
+                if since is not None and since < 0:
+                    raise ValueError('Некорректный номер изменения')
+                
+                paginated = 'limit' in query_params or 'after' in query_params
+                limit = parse_limit(query_params.get('limit'), DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE) if paginated else None
+                after = decode_cursor(query_params['after']) if query_params.get('after') else None
+            except ValueError:
+                return bad_request_response()
+            
+            version = get_data_version(cursor, 'marks')
+            etag = build_etag('marks', version, query_params)
+            cache_headers = {
+                **headers,
+                'ETag': etag,
+                'Cache-Control': PUBLIC_CACHE_CONTROL if verified_only else REVALIDATE_CACHE_CONTROL,
+                'Vary': 'Accept-Encoding'
+            }
+            
+            cached = _response_cache.lookup(response_cache_key, version)
+            if cached:
+                return cached_response(cached, event)
+            
+            if is_not_modified(event, etag):
+                return {
+                    'statusCode': 304,
+                    'headers': cache_headers,
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+            
+            if since is not None:
+                changes = fetch_changes(cursor, since, verified_only)
+                with trace_span('serialize'):
+                    body = changes_body(changes)
+                _response_cache.store(response_cache_key, version, cache_headers, body)
+                
+                return cached_response(_response_cache[response_cache_key], event)
+            
+            conditions = []
+            params = []
             
             if verified_only:
-                cursor.execute('''
-                    SELECT id, type, latitude, longitude, verified, created_at, description
+                conditions.append('verified = true')
+            
+            if bbox:
+                conditions.append('point(longitude, latitude) <@ box(point(%s, %s), point(%s, %s))')
+                params.extend(bbox)
+            
+            where_clause = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+            
+            if clustered:
+                cell_size = cluster_cell_size(zoom)
+                cursor.execute(f'''
+                    SELECT 
+                        COUNT(*),
+                        SUM(CASE WHEN type = 'tick' THEN 1 ELSE 0 END),
+                        SUM(CASE WHEN type = 'hogweed' THEN 1 ELSE 0 END),
+                        AVG(latitude),
+                        AVG(longitude)
                     FROM marks
-                    WHERE verified = true
-                    ORDER BY created_at DESC
-                ''')
-            else:
-                cursor.execute('''
-                    SELECT id, type, latitude, longitude, verified, created_at, description
+                    {where_clause}
+                    GROUP BY FLOOR(longitude / %s), FLOOR(latitude / %s)
+                ''', params + [cell_size, cell_size])
+                
+                clusters = []
+                for row in cursor.fetchall():
+                    clusters.append({
+                        'count': row[0],
+                        'tick': row[1],
+                        'hogweed': row[2],
+                        'lat': float(row[3]),
+                        'lng': float(row[4])
+                    })
+                
+                with trace_span('serialize'):
+                    body = json.dumps({'clusters': clusters, 'cellSize': cell_size})
+                _response_cache.store(response_cache_key, version, cache_headers, body)
+                
+                return cached_response(_response_cache[response_cache_key], event)
+            
+            if after:
+                condition, condition_params = keyset_condition(after)
+                conditions.append(condition)
+                params.extend(condition_params)
+            
+            where_clause = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+            limit_clause = 'LIMIT %s' if paginated else ''
+            if paginated:
+                params.append(limit + 1)
+            
+            # Номер изменения читается до выборки: лента ?since=<seq> продолжается с него и может
+            # повторить лишь изменения, уже попавшие в выборку, но не пропустить ни одного
+            latest_seq = get_latest_change_seq(cursor)
+            
+            # Прореживается только целое окно карты: постраничной выдаче нужен сплошной порядок для курсора.
+            # Тип и статус проверки входят в ключ ячейки, чтобы ожидающая проверки метка не скрыла проверенную
+            # или метку другого типа; cell_count - сколько меток группы представляет отданная
+            thinning_cell = thinning_cell_size(zoom) if bbox and zoom is not None and not paginated else None
+            source = 'marks'
+            count_column = '1'
+            count_field = ''
+            if thinning_cell:
+                cell_key = 'floor(longitude::float8 / %s), floor(latitude::float8 / %s), type, verified'
+                source = f'''(
+                    SELECT DISTINCT ON ({cell_key}) *, COUNT(*) OVER (PARTITION BY {cell_key}) AS cell_count
                     FROM marks
-                    ORDER BY created_at DESC
-                ''')
+                    {where_clause}
+                    ORDER BY {cell_key}, created_at DESC, id DESC
+                ) thinned'''
+                params = [thinning_cell, thinning_cell, thinning_cell, thinning_cell, *params, thinning_cell, thinning_cell]
+                where_clause = ''
+                count_column = 'cell_count'
+                count_field = ", 'count', cell_count"
+            
+            mark_json = 'NULL' if output_format == 'columnar' else f'{mark_json_sql(extra=count_field)}::text'
+            
+            cursor.execute(f'''
+                SELECT 
+                    id, type, latitude::float8, longitude::float8, verified, created_at, description,
+                    EXTRACT(EPOCH FROM created_at)::bigint, report_count, {count_column}, {mark_json}
+                FROM {source}
+                {where_clause}
+                ORDER BY created_at DESC, id DESC
+                {limit_clause}
+            ''', params)
             
             rows = cursor.fetchall()
-            marks = []
-            for row in rows:
-                marks.append({
-                    'id': row[0],
-                    'type': row[1],
-                    'lat': float(row[2]),
-                    'lng': float(row[3]),
-                    'verified': row[4],
-                    'date': row[5].isoformat() if row[5] else None,
-                    'description': row[6]
-                })
+            next_cursor = None
+            if paginated and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1][5], rows[-1][0])
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'marks': marks}),
-                'isBase64Encoded': False
-            }
+            # JSON-строки меток уже собраны в Postgres и склеиваются в ответ без повторной сериализации
+            fragments = {}
+            if output_format == 'columnar':
+                columns = list(zip(*rows)) if rows else [()] * 11
+                response_columns = {
+                    'id': columns[0],
+                    'type': columns[1],
+                    'lat': columns[2],
+                    'lng': columns[3],
+                    'verified': columns[4],
+                    'timestamp': columns[7],
+                    'description': columns[6],
+                    'reports': columns[8]
+                }
+                if thinning_cell:
+                    response_columns['count'] = columns[9]
+                with trace_span('serialize'):
+                    fragments['columns'] = json.dumps(response_columns)
+            else:
+                fragments['marks'] = '[' + ', '.join(row[10] for row in rows) + ']'
+            
+            fragments['seq'] = json.dumps(latest_seq)
+            if thinning_cell:
+                fragments['cellSize'] = json.dumps(thinning_cell)
+            if paginated:
+                fragments['nextCursor'] = json.dumps(next_cursor)
+            
+            body = json_object_text(fragments)
+            _response_cache.store(response_cache_key, version, cache_headers, body)
+            
+            return cached_response(_response_cache[response_cache_key], event)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
@@ -111,47 +552,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             longitude = body_data.get('longitude')
             description = body_data.get('description', '')
             
-            request_context = event.get('requestContext', {})
-            identity = request_context.get('identity', {})
-            user_ip = identity.get('sourceIp', 'unknown')
+            user_ip = get_client_ip(event)
             user_agent = event.get('headers', {}).get('user-agent', '')
             
-            cursor.execute('''
-                SELECT action_count, last_action 
-                FROM rate_limits 
-                WHERE user_ip = %s AND action_type = 'add_mark'
-            ''', (user_ip,))
-            
-            rate_limit = cursor.fetchone()
-            if rate_limit:
-                count, last_action = rate_limit
-                time_diff = datetime.now() - last_action
-                
-                if time_diff < timedelta(hours=1) and count >= 5:
-                    return {
-                        'statusCode': 429,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'Превышен лимит: максимум 5 меток в час'}),
-                        'isBase64Encoded': False
-                    }
+            if not check_rate_limit(cursor, user_ip, 'add_mark', RATE_LIMIT_MARKS_PER_HOUR, RATE_LIMIT_MARKS_PER_HOUR / 3600):
+                return error_response(429, {'error': f'Превышен лимит: максимум {RATE_LIMIT_MARKS_PER_HOUR} меток в час'})
+            
+            duplicate = merge_duplicate_mark(cursor, mark_type, latitude, longitude, description)
+            if duplicate:
+                conn.commit()
+                _response_cache.clear()
+                compact_changes(conn, cursor)
                 
-                if time_diff >= timedelta(hours=1):
-                    cursor.execute('''
-                        UPDATE rate_limits 
-                        SET action_count = 1, last_action = CURRENT_TIMESTAMP
-                        WHERE user_ip = %s AND action_type = 'add_mark'
-                    ''', (user_ip,))
-                else:
-                    cursor.execute('''
-                        UPDATE rate_limits 
-                        SET action_count = action_count + 1, last_action = CURRENT_TIMESTAMP
-                        WHERE user_ip = %s AND action_type = 'add_mark'
-                    ''', (user_ip,))
-            else:
-                cursor.execute('''
-                    INSERT INTO rate_limits (user_ip, action_type, action_count, last_action)
-                    VALUES (%s, 'add_mark', 1, CURRENT_TIMESTAMP)
-                ''', (user_ip,))
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'success': True,
+                        'id': duplicate[0],
+                        'duplicate': True,
+                        'reports': duplicate[1],
+                        'descriptionMerged': duplicate[2],
+                        'message': 'Такая метка уже есть, ваше сообщение и описание учтены' if duplicate[2] else 'Такая метка уже есть, ваше сообщение учтено'
+                    }),
+                    'isBase64Encoded': False
+                }
             
             cursor.execute('''
                 INSERT INTO marks (type, latitude, longitude, user_ip, user_agent, description)
@@ -160,9 +585,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             ''', (mark_type, latitude, longitude, user_ip, user_agent, description))
             
             mark_id = cursor.fetchone()[0]
-            conn.commit()
             
-            send_telegram_notification(mark_type, latitude, longitude, description)
+            cursor.execute('''
+                INSERT INTO notification_outbox (mark_id, payload)
+                VALUES (%s, %s)
+            ''', (mark_id, json.dumps({
+                'type': mark_type,
+                'latitude': latitude,
+                'longitude': longitude,
+                'description': description
+            })))
+            
+            conn.commit()
+            _response_cache.clear()
+            compact_changes(conn, cursor)
             
             return {
                 'statusCode': 201,
@@ -172,19 +608,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         elif method == 'PUT':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
+            admin_token = get_admin_token(event)
+            
+            try:
+                body_data = parse_json_object(event.get('body'))
+            except ValueError:
+                return bad_request_response('Тело запроса должно быть JSON-объектом')
             
-            body_data = json.loads(event.get('body', '{}'))
             mark_id = body_data.get('id')
             verified = body_data.get('verified')
             
+            if 'ids' in body_data or 'filter' in body_data:
+                try:
+                    if not isinstance(verified, bool):
+                        raise ValueError('verified должен быть true или false')
+                    results = run_bulk_moderation(
+                        cursor,
+                        'UPDATE marks SET verified = %s, verified_at = CURRENT_TIMESTAMP, verified_by = %s',
+                        [verified, admin_token],
+                        body_data,
+                        'updated'
+                    )
+                except ValueError:
+                    return bad_request_response()
+                
+                conn.commit()
+                _response_cache.clear()
+                compact_changes(conn, cursor)
+                
+                return bulk_response(results, headers)
+            
             cursor.execute('''
                 UPDATE marks 
                 SET verified = %s, verified_at = CURRENT_TIMESTAMP, verified_by = %s
@@ -192,6 +648,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             ''', (verified, admin_token, mark_id))
             
             conn.commit()
+            _response_cache.clear()
+            compact_changes(conn, cursor)
             
             return {
                 'statusCode': 200,
@@ -201,20 +659,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         elif method == 'DELETE':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
             
             query_params = event.get('queryStringParameters', {}) or {}
             mark_id = query_params.get('id')
             
+            if mark_id is None and event.get('body'):
+                try:
+                    results = run_bulk_moderation(cursor, 'DELETE FROM marks', [], parse_json_object(event['body']), 'deleted')
+                except ValueError:
+                    return bad_request_response()
+                
+                conn.commit()
+                _response_cache.clear()
+                compact_changes(conn, cursor)
+                
+                return bulk_response(results, headers)
+            
             cursor.execute('DELETE FROM marks WHERE id = %s', (mark_id,))
             conn.commit()
+            _response_cache.clear()
+            compact_changes(conn, cursor)
             
             return {
                 'statusCode': 200,
@@ -225,11 +692,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
     
-    return {
-        'statusCode': 405,
-        'headers': headers,
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return method_not_allowed_response()
\ No newline at end of file
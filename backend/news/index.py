@@ -1,8 +1,29 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from function_runtime import (
+    JSON_HEADERS, ResponseCache, bad_request_response, build_etag, cached_response,
+    check_rate_limit, decode_cursor, encode_cursor, error_response, fetch_json_fragments,
+    get_admin_token, get_client_ip, get_data_version, get_db_connection, is_not_modified,
+    json_object_text, keyset_condition, map_layer_rows_sql, map_layer_sql,
+    method_not_allowed_response, parse_limit, preflight_headers, release_db_connection,
+    require_admin, trace_span, traced
+)
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+RATE_LIMIT_POSTS_PER_HOUR = 60
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=30, stale-while-revalidate=300'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 128
+
+PREFLIGHT_HEADERS = preflight_headers('GET, POST, PUT, DELETE, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+@traced('news')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления новостями системы мониторинга
@@ -15,62 +36,94 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': PREFLIGHT_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
+    if method == 'GET':
+        response_cache_key = json.dumps(event.get('queryStringParameters') or {}, sort_keys=True)
+        cached = _response_cache.lookup(response_cache_key)
+        if cached:
+            return cached_response(cached, event)
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
     
     try:
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, title, content, author, created_at, image_url
-                FROM news
-                WHERE published = true
-                ORDER BY created_at DESC
-            ''')
+            query_params = event.get('queryStringParameters', {}) or {}
+            
+            try:
+                paginated = 'limit' in query_params or 'after' in query_params
+                limit = parse_limit(query_params.get('limit'), DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE) if paginated else None
+                after = decode_cursor(query_params['after']) if query_params.get('after') else None
+            except ValueError:
+                return bad_request_response()
+            
+            version = get_data_version(cursor, 'news')
+            etag = build_etag('news', version, query_params)
+            cache_headers = {**headers, 'ETag': etag, 'Cache-Control': PUBLIC_CACHE_CONTROL}
             
-            rows = cursor.fetchall()
-            news_list = []
-            for row in rows:
-                news_list.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'author': row[3],
-                    'date': row[4].isoformat() if row[4] else None,
-                    'imageUrl': row[5]
-                })
+            cached = _response_cache.lookup(response_cache_key, version)
+            if cached:
+                return cached_response(cached, event)
+            
+            if is_not_modified(event, etag):
+                return {
+                    'statusCode': 304,
+                    'headers': cache_headers,
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+            
+            # Строки собираются тем же map_layer_rows_sql, что и слой news в bootstrap
+            if not paginated:
+                fragments = fetch_json_fragments(cursor, {'news': map_layer_sql('news')})
+            else:
+                conditions = []
+                params = []
+                
+                if after:
+                    condition, condition_params = keyset_condition(after)
+                    conditions.append(condition)
+                    params.extend(condition_params)
+                params.append(limit + 1)
+                
+                cursor.execute(map_layer_rows_sql('news', conditions, 'created_at, id', limit=True), params)
+                
+                rows = cursor.fetchall()
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+                
+                fragments = {
+                    'news': '[' + ', '.join(row[0] for row in rows) + ']',
+                    'nextCursor': json.dumps(next_cursor)
+                }
+            
+            with trace_span('serialize'):
+                body = json_object_text(fragments)
+            _response_cache.store(response_cache_key, version, cache_headers, body)
             
             return {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'news': news_list}),
+                'headers': cache_headers,
+                'body': body,
                 'isBase64Encoded': False
             }
         
         elif method == 'POST':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
+            admin_token = get_admin_token(event)
+            
+            if not check_rate_limit(cursor, get_client_ip(event), 'add_news', RATE_LIMIT_POSTS_PER_HOUR, RATE_LIMIT_POSTS_PER_HOUR / 3600):
+                return error_response(429, {'error': f'Превышен лимит: максимум {RATE_LIMIT_POSTS_PER_HOUR} новостей в час'})
             
             body_data = json.loads(event.get('body', '{}'))
             
@@ -87,6 +140,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             news_id = cursor.fetchone()[0]
             conn.commit()
+            _response_cache.clear()
             
             return {
                 'statusCode': 201,
@@ -96,20 +150,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         elif method == 'DELETE':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
             
             query_params = event.get('queryStringParameters', {}) or {}
             news_id = query_params.get('id')
             
             cursor.execute('DELETE FROM news WHERE id = %s', (news_id,))
             conn.commit()
+            _response_cache.clear()
             
             return {
                 'statusCode': 200,
@@ -120,11 +170,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
     
-    return {
-        'statusCode': 405,
-        'headers': headers,
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
-        'isBase64Encoded': False
-    }
+    return method_not_allowed_response()
@@ -0,0 +1,262 @@
+import hmac
+import json
+import os
+from typing import Dict, Any, List, Tuple
+from function_runtime import (
+    JSON_HEADERS, forbidden_response, get_db_connection, is_admin_token, preflight_headers,
+    release_db_connection, traced, traced_phase
+)
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_MAX_BATCHES = 5
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_MAX_BACKOFF_MINUTES = 60
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_SENT_RETENTION_DAYS = 7
+OUTBOX_DEAD_RETENTION_DAYS = 30
+OUTBOX_PURGE_BATCH_SIZE = 1000
+TELEGRAM_TIMEOUT = 10
+TELEGRAM_MESSAGE_MAX_LENGTH = 4096
+DESCRIPTION_MAX_LENGTH = 200
+
+PREFLIGHT_HEADERS = preflight_headers('GET, POST, OPTIONS')
+
+def mark_type_label(mark_type: str) -> Tuple[str, str]:
+    if mark_type == 'tick':
+        return '🦂', 'Клещ'
+    return '🌿', 'Борщевик'
+
+def truncate_description(description: Any, max_length: int = DESCRIPTION_MAX_LENGTH) -> str:
+    text = str(description).strip()
+    if len(text) <= max_length:
+        return text
+    return text[:max_length - 1].rstrip() + '…'
+
+def format_mark_line(payload: Dict[str, Any]) -> str:
+    type_emoji, type_text = mark_type_label(payload.get('type'))
+    description = truncate_description(payload['description']) if payload.get('description') else 'без описания'
+    return f"{type_emoji} {type_text} ({float(payload['latitude']):.4f}, {float(payload['longitude']):.4f}): {description}"
+
+def telegram_length(text: str) -> int:
+    # Лимит Telegram считается в единицах UTF-16: эмодзи занимают по две
+    return len(text.encode('utf-16-le')) // 2
+
+def build_single_message(payload: Dict[str, Any]) -> str:
+    type_emoji, type_text = mark_type_label(payload.get('type'))
+    description = truncate_description(payload['description']) if payload.get('description') else 'не указано'
+    return f"""
+🔔 Новая метка!
+
+{type_emoji} Тип: {type_text}
+📍 Координаты: {float(payload['latitude']):.4f}, {float(payload['longitude']):.4f}
+📝 Описание: {description}
+
+✅ Требуется проверка администратором
+        """
+
+def build_digest_message(lines: List[str], total: int, part: int, parts: int) -> str:
+    heading = f'🔔 Новых меток: {total}' + (f' (часть {part}/{parts})' if parts > 1 else '')
+    body = '\n'.join(lines)
+    return f"""
+{heading}
+
+{body}
+
+✅ Требуется проверка администратором
+    """
+
+def build_digest_messages(rows: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[List[int], str]]:
+    # Дайджест делится на сообщения не длиннее TELEGRAM_MESSAGE_MAX_LENGTH; каждое отмечается отправленным отдельно
+    if len(rows) == 1:
+        return [([rows[0][0]], build_single_message(rows[0][1]))]
+    
+    reserve = telegram_length(build_digest_message([], len(rows), len(rows), len(rows)))
+    chunks: List[List[Tuple[int, str]]] = [[]]
+    size = reserve
+    for outbox_id, payload in rows:
+        line = format_mark_line(payload)
+        line_length = telegram_length(line) + 1
+        if chunks[-1] and size + line_length > TELEGRAM_MESSAGE_MAX_LENGTH:
+            chunks.append([])
+            size = reserve
+        chunks[-1].append((outbox_id, line))
+        size += line_length
+    
+    return [
+        ([outbox_id for outbox_id, _ in chunk], build_digest_message([line for _, line in chunk], len(rows), part, len(chunks)))
+        for part, chunk in enumerate(chunks, start=1)
+    ]
+
+@traced_phase('telegram')
+def send_message(bot_token: str, chat_id: str, text: str):
+    import requests
+    
+    response = requests.post(
+        f'{TELEGRAM_API_URL}/bot{bot_token}/sendMessage',
+        json={'chat_id': chat_id, 'text': text},
+        timeout=TELEGRAM_TIMEOUT
+    )
+    response.raise_for_status()
+
+def claim_outbox_batch(conn, cursor) -> List[Tuple[int, Dict[str, Any]]]:
+    # Строки забираются короткой транзакцией и откладываются на время аренды: Telegram вызывается без блокировок строк,
+    # а если функция упадет до отметки об отправке, строки вернутся в очередь, когда аренда истечет
+    cursor.execute('''
+        UPDATE notification_outbox
+        SET attempts = attempts + 1,
+            next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        WHERE id IN (
+            SELECT id
+            FROM notification_outbox
+            WHERE sent_at IS NULL 
+                AND dead_at IS NULL
+                AND next_attempt_at <= CURRENT_TIMESTAMP
+                AND attempts < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, payload
+    ''', (OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BATCH_SIZE))
+    rows = sorted(cursor.fetchall())
+    conn.commit()
+    return rows
+
+def sweep_outbox(conn) -> int:
+    cursor = conn.cursor()
+    
+    try:
+        # Последняя попытка могла оборваться вместе с функцией: такие строки уходят в dead letter, когда истекла их аренда
+        cursor.execute('''
+            UPDATE notification_outbox
+            SET dead_at = CURRENT_TIMESTAMP
+            WHERE sent_at IS NULL 
+                AND dead_at IS NULL
+                AND attempts >= %s
+                AND next_attempt_at <= CURRENT_TIMESTAMP
+            RETURNING id
+        ''', (OUTBOX_MAX_ATTEMPTS,))
+        dead = cursor.rowcount
+        
+        # Не больше OUTBOX_PURGE_BATCH_SIZE строк за вызов: первая очистка большой очереди не держит долгую транзакцию
+        cursor.execute('''
+            DELETE FROM notification_outbox
+            WHERE id IN (
+                SELECT id
+                FROM notification_outbox
+                WHERE sent_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                    OR dead_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                LIMIT %s
+            )
+        ''', (OUTBOX_SENT_RETENTION_DAYS, OUTBOX_DEAD_RETENTION_DAYS, OUTBOX_PURGE_BATCH_SIZE))
+        conn.commit()
+    finally:
+        cursor.close()
+    
+    return dead
+
+def drain_outbox(conn, bot_token: str, chat_id: str) -> Tuple[int, int, int]:
+    sent = 0
+    failed = 0
+    dead = 0
+    cursor = conn.cursor()
+    
+    try:
+        for _ in range(OUTBOX_MAX_BATCHES):
+            rows = claim_outbox_batch(conn, cursor)
+            if not rows:
+                break
+            
+            # requests грузится ~100 мс, поэтому импортируется только когда в очереди есть что отправлять
+            import requests
+            
+            messages = build_digest_messages(rows)
+            for index, (ids, text) in enumerate(messages):
+                try:
+                    send_message(bot_token, chat_id, text)
+                except requests.RequestException as e:
+                    print(f'Ошибка отправки уведомления: {e}')
+                    pending = [outbox_id for message_ids, _ in messages[index:] for outbox_id in message_ids]
+                    # attempts уже увеличен при захвате строк; после последней попытки строка уходит в dead letter
+                    cursor.execute('''
+                        UPDATE notification_outbox
+                        SET next_attempt_at = CURRENT_TIMESTAMP + LEAST(POWER(2, attempts - 1), %s) * INTERVAL '1 minute',
+                            dead_at = CASE WHEN attempts >= %s THEN CURRENT_TIMESTAMP END,
+                            last_error = %s
+                        WHERE id = ANY(%s)
+                        RETURNING dead_at IS NOT NULL
+                    ''', (OUTBOX_MAX_BACKOFF_MINUTES, OUTBOX_MAX_ATTEMPTS, str(e), pending))
+                    dead += sum(1 for row in cursor.fetchall() if row[0])
+                    conn.commit()
+                    failed += len(pending)
+                    return sent, failed, dead
+                
+                cursor.execute('''
+                    UPDATE notification_outbox
+                    SET sent_at = CURRENT_TIMESTAMP
+                    WHERE id = ANY(%s)
+                ''', (ids,))
+                conn.commit()
+                sent += len(ids)
+    finally:
+        cursor.close()
+    
+    return sent, failed, dead
+
+def is_authorized(event: Dict[str, Any]) -> bool:
+    # Cron передает общий секрет NOTIFICATIONS_SECRET в X-Admin-Token или ?token=, администраторы - свой токен
+    token = (event.get('headers') or {}).get('x-admin-token') or (event.get('queryStringParameters') or {}).get('token') or ''
+    if is_admin_token(token):
+        return True
+    
+    secret = os.environ.get('NOTIFICATIONS_SECRET', '')
+    return bool(secret) and hmac.compare_digest(token.encode('utf-8'), secret.encode('utf-8'))
+
+@traced('notifications')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Пакетная отправка уведомлений о новых метках из очереди в Telegram
+    Args: event - HTTP запрос (вызывается по расписанию)
+          context - контекст выполнения
+    Returns: Количество отправленных, отложенных и исчерпавших попытки уведомлений
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if not is_authorized(event):
+        return forbidden_response('Требуется токен администратора или NOTIFICATIONS_SECRET')
+    
+    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+    
+    if not bot_token or not chat_id:
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({'success': True, 'sent': 0, 'failed': 0, 'dead': 0, 'message': 'Telegram не настроен'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_db_connection()
+    try:
+        expired = sweep_outbox(conn)
+        sent, failed, dead = drain_outbox(conn, bot_token, chat_id)
+    finally:
+        release_db_connection(conn)
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'success': True, 'sent': sent, 'failed': failed, 'dead': expired + dead}),
+        'isBase64Encoded': False
+    }
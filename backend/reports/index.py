@@ -1,205 +1,467 @@
+import base64
 import json
 import os
 import psycopg2
-import requests
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from io import BytesIO
-from typing import Dict, Any
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from function_runtime import (
+    JSON_HEADERS, PoolTimeout, bad_request_response, check_rate_limit, error_response,
+    get_client_ip, get_db_connection, preflight_headers, release_db_connection, require_admin,
+    trace_span, traced, traced_phase
+)
 
+REPORT_TITLE = 'ОТЧЕТ ПО МЕТКАМ КЛЕЩЕЙ И БОРЩЕВИКА'
+REPORT_HEADERS = ['ID', 'Тип', 'Широта', 'Долгота', 'Дата/Время', 'Описание', 'Статус']
+REPORT_MARKS_FETCH_SIZE = 2000
+REPORT_MAX_DAYS = 366
+REPORT_ARTIFACT_TTL_DAYS = 30
+REPORT_FORMATS = ('telegram', 'xlsx')
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+REPORT_MAX_COLUMN_WIDTH = 50
+REPORT_COORDINATE_LENGTH = 12
+REPORT_SENDS_PER_HOUR = 6
+TELEGRAM_TIMEOUT = 10
+TELEGRAM_UPLOAD_TIMEOUT = 60
+
+PREFLIGHT_HEADERS = preflight_headers('GET, POST, OPTIONS')
+
+def parse_report_range(query_params: Dict[str, str], today: date) -> Tuple[date, date]:
+    period = query_params.get('period', 'day')
+    
+    if query_params.get('from'):
+        date_from = date.fromisoformat(query_params['from'])
+        date_to = date.fromisoformat(query_params['to']) if query_params.get('to') else date_from
+    elif period == 'day':
+        date_from = date_to = today - timedelta(days=1)
+    elif period == 'week':
+        date_from = today - timedelta(days=today.weekday() + 7)
+        date_to = date_from + timedelta(days=6)
+    elif period == 'month':
+        date_to = today.replace(day=1) - timedelta(days=1)
+        date_from = date_to.replace(day=1)
+    else:
+        raise ValueError('Неизвестный период отчета')
+    
+    if date_from > date_to or date_to > today:
+        raise ValueError('Некорректный период отчета')
+    if (date_to - date_from).days >= REPORT_MAX_DAYS:
+        raise ValueError('Слишком длинный период отчета')
+    
+    return date_from, date_to
+
+def report_label(date_from: date, date_to: date) -> str:
+    if date_from == date_to:
+        return date_from.strftime('%d.%m.%Y')
+    return f"{date_from.strftime('%d.%m.%Y')} - {date_to.strftime('%d.%m.%Y')}"
+
+def get_range_version(cursor, date_from: date, date_to: date) -> int:
+    # Версии дней только растут, поэтому их сумма меняется при любом изменении меток за период
+    cursor.execute('''
+        SELECT COALESCE(SUM(version), 0)
+        FROM marks_day_versions
+        WHERE day BETWEEN %s AND %s
+    ''', (date_from, date_to))
+    return cursor.fetchone()[0]
+
+def get_report_artifact(cursor, date_from: date, date_to: date, version: int) -> Optional[Dict[str, Any]]:
+    cursor.execute('''
+        SELECT mark_count, tick_count, hogweed_count, verified_count, workbook
+        FROM report_artifacts
+        WHERE date_from = %s AND date_to = %s AND version = %s
+    ''', (date_from, date_to, version))
+    
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    
+    return {
+        'total': row[0],
+        'tick': row[1],
+        'hogweed': row[2],
+        'verified': row[3],
+        'workbook': bytes(row[4]) if row[4] is not None else None
+    }
+
+def store_report_artifact(cursor, date_from: date, date_to: date, version: int, artifact: Dict[str, Any]):
+    cursor.execute('''
+        INSERT INTO report_artifacts (date_from, date_to, version, mark_count, tick_count, hogweed_count, verified_count, workbook)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (date_from, date_to) DO UPDATE SET
+            version = EXCLUDED.version,
+            mark_count = EXCLUDED.mark_count,
+            tick_count = EXCLUDED.tick_count,
+            hogweed_count = EXCLUDED.hogweed_count,
+            verified_count = EXCLUDED.verified_count,
+            workbook = EXCLUDED.workbook,
+            built_at = CURRENT_TIMESTAMP
+        WHERE report_artifacts.version <= EXCLUDED.version
+    ''', (
+        date_from, date_to, version,
+        artifact['total'], artifact['tick'], artifact['hogweed'], artifact['verified'],
+        psycopg2.Binary(artifact['workbook']) if artifact['workbook'] is not None else None
+    ))
+    cursor.execute(
+        "DELETE FROM report_artifacts WHERE built_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'",
+        (REPORT_ARTIFACT_TTL_DAYS,)
+    )
+
+def refresh_report_parts(conn, date_from: date, date_to: date) -> int:
+    # Части хранят только счетчики дня: пересчитываются одним агрегирующим запросом дни без части или
+    # с изменившейся версией, версия и счетчики берутся из одного снимка, строки меток в Python не читаются
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            WITH stale AS (
+                SELECT d::date AS day, COALESCE(v.version, 0) AS version
+                FROM generate_series(%s::date, %s::date, INTERVAL '1 day') d
+                LEFT JOIN marks_day_versions v ON v.day = d::date
+                LEFT JOIN report_parts p ON p.day = d::date
+                WHERE p.day IS NULL OR p.version <> COALESCE(v.version, 0)
+            )
+            INSERT INTO report_parts (day, version, mark_count, tick_count, hogweed_count, verified_count, max_id, max_description_length)
+            SELECT
+                s.day, s.version,
+                COUNT(m.id),
+                COUNT(m.id) FILTER (WHERE m.type = 'tick'),
+                COUNT(m.id) FILTER (WHERE m.type = 'hogweed'),
+                COUNT(m.id) FILTER (WHERE m.verified),
+                MAX(m.id),
+                MAX(LENGTH(m.description))
+            FROM stale s
+            LEFT JOIN marks m ON m.created_at >= s.day AND m.created_at < s.day + 1
+            GROUP BY s.day, s.version
+            ON CONFLICT (day) DO UPDATE SET
+                version = EXCLUDED.version,
+                mark_count = EXCLUDED.mark_count,
+                tick_count = EXCLUDED.tick_count,
+                hogweed_count = EXCLUDED.hogweed_count,
+                verified_count = EXCLUDED.verified_count,
+                max_id = EXCLUDED.max_id,
+                max_description_length = EXCLUDED.max_description_length,
+                built_at = CURRENT_TIMESTAMP
+        ''', (date_from, date_to))
+        refreshed = cursor.rowcount
+        conn.commit()
+    finally:
+        cursor.close()
+    
+    return refreshed
+
+def fetch_report_summary(cursor, date_from: date, date_to: date) -> Tuple[int, int, int, int, int, int]:
+    cursor.execute('''
+        SELECT 
+            COALESCE(SUM(mark_count), 0), COALESCE(SUM(tick_count), 0),
+            COALESCE(SUM(hogweed_count), 0), COALESCE(SUM(verified_count), 0),
+            COALESCE(MAX(max_id), 0), COALESCE(MAX(max_description_length), 0)
+        FROM report_parts
+        WHERE day BETWEEN %s AND %s
+    ''', (date_from, date_to))
+    return tuple(int(value) for value in cursor.fetchone())
+
+def iter_report_rows(conn, date_from: date, date_to: date) -> Iterator[Tuple[Any, ...]]:
+    # Строки идут из marks именованным курсором прямо в книгу: в памяти не больше REPORT_MARKS_FETCH_SIZE строк
+    marks_cursor = conn.cursor(name='report_marks')
+    marks_cursor.itersize = REPORT_MARKS_FETCH_SIZE
+    try:
+        marks_cursor.execute('''
+            SELECT 
+                id, type, latitude::float8, longitude::float8,
+                TO_CHAR(created_at, 'DD.MM.YYYY HH24:MI'), description, verified
+            FROM marks
+            WHERE created_at >= %s AND created_at < %s
+            ORDER BY created_at DESC
+        ''', (date_from, date_to + timedelta(days=1)))
+        yield from marks_cursor
+    finally:
+        marks_cursor.close()
+
+def build_report_artifact(conn, date_from: date, date_to: date) -> Dict[str, Any]:
+    refresh_report_parts(conn, date_from, date_to)
+    cursor = conn.cursor()
+    try:
+        total_marks, tick_count, hogweed_count, verified_count, max_id, max_description_length = fetch_report_summary(cursor, date_from, date_to)
+    finally:
+        cursor.close()
+    
+    artifact = {'total': total_marks, 'tick': tick_count, 'hogweed': hogweed_count, 'verified': verified_count, 'workbook': None}
+    if total_marks == 0:
+        return artifact
+    
+    label = report_label(date_from, date_to)
+    summary_lines = [
+        f'Всего меток: {total_marks}',
+        f'Клещи: {tick_count}',
+        f'Борщевик: {hogweed_count}',
+        f'Проверено: {verified_count}'
+    ]
+    
+    try:
+        excel_buffer = build_excel_report(
+            iter_report_rows(conn, date_from, date_to),
+            label,
+            summary_lines,
+            report_column_widths(label, summary_lines, max_id, max_description_length)
+        )
+        artifact['workbook'] = excel_buffer.getvalue()
+    except ImportError:
+        pass
+    
+    return artifact
+
+def report_column_widths(label: str, summary_lines: List[str], max_id: int, max_description_length: int) -> List[int]:
+    first_column = [REPORT_TITLE, f'Дата: {label}', 'СТАТИСТИКА', *summary_lines, str(max_id)]
+    lengths = [
+        max(len(value) for value in first_column),
+        len('Борщевик'),
+        REPORT_COORDINATE_LENGTH,
+        REPORT_COORDINATE_LENGTH,
+        len('DD.MM.YYYY HH:MI'),
+        max(len(REPORT_HEADERS[5]), max_description_length),
+        len('На проверке')
+    ]
+    return [min(max(length, len(header)) + 2, REPORT_MAX_COLUMN_WIDTH) for length, header in zip(lengths, REPORT_HEADERS)]
+
+@traced_phase('excel')
+def build_excel_report(marks_rows: Iterable[Tuple[Any, ...]], label: str, summary_lines: List[str], column_widths: List[int]) -> BytesIO:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+    
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(f'Отчет {label}')
+    
+    for col_num, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+    
+    title = WriteOnlyCell(ws, value=REPORT_TITLE)
+    title.font = Font(size=14, bold=True)
+    title.alignment = Alignment(horizontal='center')
+    ws.append([title])
+    ws.merged_cells.add('A1:G1')
+    
+    date_cell = WriteOnlyCell(ws, value=f'Дата: {label}')
+    date_cell.font = Font(bold=True)
+    ws.append([date_cell])
+    ws.append([])
+    
+    stats_title = WriteOnlyCell(ws, value='СТАТИСТИКА')
+    stats_title.font = Font(size=12, bold=True)
+    ws.append([stats_title])
+    for line in summary_lines:
+        ws.append([line])
+    ws.append([])
+    
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+    header_font = Font(color='FFFFFF', bold=True)
+    header_cells = []
+    for header in REPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center')
+        header_cells.append(cell)
+    ws.append(header_cells)
+    
+    for mark in marks_rows:
+        ws.append([
+            mark[0],
+            'Клещ' if mark[1] == 'tick' else 'Борщевик',
+            float(mark[2]),
+            float(mark[3]),
+            mark[4],
+            mark[5] or '-',
+            'Проверено' if mark[6] else 'На проверке'
+        ])
+    
+    excel_buffer = BytesIO()
+    wb.save(excel_buffer)
+    excel_buffer.seek(0)
+    return excel_buffer
+
+def build_text_report(first_marks: List[Tuple[Any, ...]], heading: str, label: str, total_marks: int, tick_count: int, hogweed_count: int, verified_count: int) -> str:
+    text_report = f"""
+📊 {heading}
+📅 Дата: {label}
+
+📍 Всего меток: {total_marks}
+🦟 Клещи: {tick_count}
+🌿 Борщевик: {hogweed_count}
+✅ Проверено: {verified_count}
+
+СПИСОК МЕТОК:
+"""
+    for mark in first_marks:
+        mark_type = 'Клещ' if mark[1] == 'tick' else 'Борщевик'
+        text_report += f"\n• {mark_type} ({mark[2]:.4f}, {mark[3]:.4f}) - {mark[4]}"
+    
+    if total_marks > len(first_marks):
+        text_report += f"\n\n...и еще {total_marks - len(first_marks)} меток"
+    
+    return text_report
+
+@traced('reports')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Автоматическая генерация и отправка отчетов по меткам
-    Args: event - HTTP запрос (можно вызывать по расписанию)
+    Business: Генерация и отправка отчетов по меткам за день, неделю, месяц или произвольный период
+    Args: event - HTTP запрос с параметрами period (day|week|month) или from/to и format=xlsx (можно вызывать по расписанию)
           context - контекст выполнения
-    Returns: Результат отправки отчета
+    Returns: Результат отправки отчета или файл XLSX
     '''
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': PREFLIGHT_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    database_url = os.environ.get('DATABASE_URL')
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
     chat_id = os.environ.get('TELEGRAM_CHAT_ID')
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
+    query_params = event.get('queryStringParameters', {}) or {}
     
     try:
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        
-        today = datetime.now().date()
-        yesterday = today - timedelta(days=1)
-        
-        cursor.execute('''
-            SELECT 
-                id, type, latitude, longitude, 
-                TO_CHAR(created_at, 'DD.MM.YYYY HH24:MI'), 
-                description, verified
-            FROM marks
-            WHERE DATE(created_at) = %s
-            ORDER BY created_at DESC
-        ''', (yesterday,))
-        
-        marks_data = cursor.fetchall()
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN type = 'tick' THEN 1 ELSE 0 END) as tick_count,
-                SUM(CASE WHEN type = 'hogweed' THEN 1 ELSE 0 END) as hogweed_count,
-                SUM(CASE WHEN verified = true THEN 1 ELSE 0 END) as verified_count
-            FROM marks
-            WHERE DATE(created_at) = %s
-        ''', (yesterday,))
-        
-        stats = cursor.fetchone()
-        total_marks = stats[0] or 0
-        tick_count = stats[1] or 0
-        hogweed_count = stats[2] or 0
-        verified_count = stats[3] or 0
-        
-        cursor.close()
-        conn.close()
+        date_from, date_to = parse_report_range(query_params, datetime.now().date())
+        output_format = query_params.get('format', 'telegram')
+        if output_format not in REPORT_FORMATS:
+            raise ValueError('Неизвестный формат отчета')
+    except ValueError:
+        return bad_request_response()
+    
+    # Произвольный период до 366 дней пересчитывается из marks, поэтому доступен только администраторам;
+    # стандартные периоды вызывает расписание без токена
+    if query_params.get('from'):
+        denied = require_admin(event)
+        if denied:
+            return denied
+    
+    send_to_telegram = output_format == 'telegram' and bool(bot_token and chat_id)
+    label = report_label(date_from, date_to)
+    heading = 'ЕЖЕДНЕВНЫЙ ОТЧЕТ' if date_from == date_to else 'ОТЧЕТ ЗА ПЕРИОД'
+    
+    try:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                # Лимит на отправку в Telegram: повторные GET не должны заваливать группу одним и тем же отчетом
+                if send_to_telegram:
+                    allowed = check_rate_limit(cursor, get_client_ip(event), 'send_report', REPORT_SENDS_PER_HOUR, REPORT_SENDS_PER_HOUR / 3600)
+                    conn.commit()
+                    if not allowed:
+                        return error_response(429, {'error': f'Превышен лимит: не более {REPORT_SENDS_PER_HOUR} отчетов в час'})
+                version = get_range_version(cursor, date_from, date_to)
+                artifact = get_report_artifact(cursor, date_from, date_to, version)
+            finally:
+                cursor.close()
+            
+            # Артефакт без книги (openpyxl не загрузился) не кэшируется, иначе format=xlsx отвечал бы 503 до следующего изменения меток
+            cached = artifact is not None and (artifact['total'] == 0 or artifact['workbook'] is not None)
+            if not cached:
+                artifact = build_report_artifact(conn, date_from, date_to)
+                if artifact['total'] == 0 or artifact['workbook'] is not None:
+                    cursor = conn.cursor()
+                    try:
+                        store_report_artifact(cursor, date_from, date_to, version, artifact)
+                        conn.commit()
+                    finally:
+                        cursor.close()
+            
+            text_report = None
+            if artifact['total'] and artifact['workbook'] is None:
+                text_report = build_text_report(
+                    list(islice(iter_report_rows(conn, date_from, date_to), 10)),
+                    heading, label, artifact['total'], artifact['tick'], artifact['hogweed'], artifact['verified']
+                )
+        finally:
+            release_db_connection(conn)
         
-        if total_marks == 0:
+        if artifact['total'] == 0:
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({'message': 'Нет меток за вчера'}),
+                'body': json.dumps({'message': f'Нет меток за {label}'}),
                 'isBase64Encoded': False
             }
         
-        try:
-            import openpyxl
-            from openpyxl.styles import Font, Alignment, PatternFill
-            
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = f"Отчет {yesterday.strftime('%d.%m.%Y')}"
-            
-            ws['A1'] = 'ОТЧЕТ ПО МЕТКАМ КЛЕЩЕЙ И БОРЩЕВИКА'
-            ws['A1'].font = Font(size=14, bold=True)
-            ws['A1'].alignment = Alignment(horizontal='center')
-            ws.merge_cells('A1:G1')
-            
-            ws['A2'] = f"Дата: {yesterday.strftime('%d.%m.%Y')}"
-            ws['A2'].font = Font(bold=True)
-            
-            ws['A4'] = 'СТАТИСТИКА'
-            ws['A4'].font = Font(size=12, bold=True)
-            ws['A5'] = f'Всего меток: {total_marks}'
-            ws['A6'] = f'Клещи: {tick_count}'
-            ws['A7'] = f'Борщевик: {hogweed_count}'
-            ws['A8'] = f'Проверено: {verified_count}'
-            
-            header_row = 10
-            headers_list = ['ID', 'Тип', 'Широта', 'Долгота', 'Дата/Время', 'Описание', 'Статус']
-            
-            header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-            header_font = Font(color='FFFFFF', bold=True)
-            
-            for col_num, header in enumerate(headers_list, 1):
-                cell = ws.cell(row=header_row, column=col_num)
-                cell.value = header
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center')
-            
-            for row_num, mark in enumerate(marks_data, header_row + 1):
-                ws.cell(row=row_num, column=1, value=mark[0])
-                ws.cell(row=row_num, column=2, value='Клещ' if mark[1] == 'tick' else 'Борщевик')
-                ws.cell(row=row_num, column=3, value=float(mark[2]))
-                ws.cell(row=row_num, column=4, value=float(mark[3]))
-                ws.cell(row=row_num, column=5, value=mark[4])
-                ws.cell(row=row_num, column=6, value=mark[5] or '-')
-                ws.cell(row=row_num, column=7, value='Проверено' if mark[6] else 'На проверке')
+        if output_format == 'xlsx':
+            if artifact['workbook'] is None:
+                return {
+                    'statusCode': 503,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Формирование XLSX недоступно'}),
+                    'isBase64Encoded': False
+                }
             
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[column].width = adjusted_width
-            
-            excel_buffer = BytesIO()
-            wb.save(excel_buffer)
-            excel_buffer.seek(0)
-            
-            if bot_token and chat_id:
-                telegram_message = f"""
-📊 ЕЖЕДНЕВНЫЙ ОТЧЕТ
-📅 Дата: {yesterday.strftime('%d.%m.%Y')}
-
-📍 Всего меток: {total_marks}
-🦟 Клещи: {tick_count}
-🌿 Борщевик: {hogweed_count}
-✅ Проверено: {verified_count}
-
-Полный отчет во вложении ⬇️
-                """
-                
-                requests.post(
-                    f'https://api.telegram.org/bot{bot_token}/sendMessage',
-                    json={'chat_id': chat_id, 'text': telegram_message}
-                )
-                
-                requests.post(
-                    f'https://api.telegram.org/bot{bot_token}/sendDocument',
-                    files={'document': (f'Отчет_{yesterday.strftime("%d.%m.%Y")}.xlsx', excel_buffer, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')},
-                    data={'chat_id': chat_id}
-                )
+            return {
+                'statusCode': 200,
+                'headers': {
+                    **headers,
+                    'Content-Type': XLSX_CONTENT_TYPE,
+                    'Content-Disposition': f'attachment; filename="report_{date_from.isoformat()}_{date_to.isoformat()}.xlsx"'
+                },
+                'body': base64.b64encode(artifact['workbook']).decode('ascii'),
+                'isBase64Encoded': True
+            }
         
-        except ImportError:
-            if bot_token and chat_id:
-                text_report = f"""
-📊 ЕЖЕДНЕВНЫЙ ОТЧЕТ
-📅 Дата: {yesterday.strftime('%d.%m.%Y')}
+        with trace_span('telegram'):
+            if send_to_telegram:
+                # requests грузится ~100 мс, поэтому импортируется только когда отчет действительно уходит в Telegram
+                import requests
+                
+                if artifact['workbook'] is not None:
+                    telegram_message = f"""
+📊 {heading}
+📅 Дата: {label}
 
-📍 Всего меток: {total_marks}
-🦟 Клещи: {tick_count}
-🌿 Борщевик: {hogweed_count}
-✅ Проверено: {verified_count}
+📍 Всего меток: {artifact['total']}
+🦟 Клещи: {artifact['tick']}
+🌿 Борщевик: {artifact['hogweed']}
+✅ Проверено: {artifact['verified']}
 
-СПИСОК МЕТОК:
-"""
-                for mark in marks_data[:10]:
-                    mark_type = 'Клещ' if mark[1] == 'tick' else 'Борщевик'
-                    text_report += f"\n• {mark_type} ({mark[2]:.4f}, {mark[3]:.4f}) - {mark[4]}"
-                
-                if len(marks_data) > 10:
-                    text_report += f"\n\n...и еще {len(marks_data) - 10} меток"
-                
-                requests.post(
-                    f'https://api.telegram.org/bot{bot_token}/sendMessage',
-                    json={'chat_id': chat_id, 'text': text_report}
-                )
+Полный отчет во вложении ⬇️
+                    """
+                    
+                    requests.post(
+                        f'https://api.telegram.org/bot{bot_token}/sendMessage',
+                        json={'chat_id': chat_id, 'text': telegram_message},
+                        timeout=TELEGRAM_TIMEOUT
+                    )
+                    
+                    requests.post(
+                        f'https://api.telegram.org/bot{bot_token}/sendDocument',
+                        files={'document': (f'Отчет_{label.replace(" ", "")}.xlsx', artifact['workbook'], XLSX_CONTENT_TYPE)},
+                        data={'chat_id': chat_id},
+                        timeout=TELEGRAM_UPLOAD_TIMEOUT
+                    )
+                else:
+                    requests.post(
+                        f'https://api.telegram.org/bot{bot_token}/sendMessage',
+                        json={'chat_id': chat_id, 'text': text_report},
+                        timeout=TELEGRAM_TIMEOUT
+                    )
         
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({'success': True, 'marks_count': total_marks}),
+            'body': json.dumps({
+                'success': True,
+                'marks_count': artifact['total'],
+                'from': date_from.isoformat(),
+                'to': date_to.isoformat(),
+                'cached': cached
+            }),
             'isBase64Encoded': False
         }
     
+    except PoolTimeout:
+        raise
     except Exception as e:
         return {
             'statusCode': 500,
@@ -0,0 +1,166 @@
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional
+from function_runtime import (
+    JSON_HEADERS, bad_request_response, build_etag, get_data_version, get_db_connection,
+    is_not_modified, method_not_allowed_response, preflight_headers, release_db_connection,
+    trace_span, traced
+)
+
+ROLLUP_CELL_SIZE = 0.01
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 3660
+MAX_CELLS = 200
+PERIODS = ('day', 'week', 'month')
+
+PUBLIC_CACHE_CONTROL = 'public, max-age=300, stale-while-revalidate=3600'
+
+PREFLIGHT_HEADERS = preflight_headers('GET, OPTIONS')
+
+def parse_date(value: Optional[str], default: date) -> date:
+    if not value:
+        return default
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+@traced('stats')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Статистика меток по периодам и участкам карты из предрассчитанных агрегатов
+    Args: event - HTTP запрос с параметрами from, to, period, group, type, verified
+          context - контекст выполнения функции
+    Returns: JSON с рядом значений по периодам или по ячейкам сетки
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = JSON_HEADERS
+    
+    if method != 'GET':
+        return method_not_allowed_response()
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        date_to = parse_date(query_params.get('to'), datetime.now().date())
+        date_from = parse_date(query_params.get('from'), date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+        period = query_params.get('period', 'day')
+        group = query_params.get('group', 'period')
+        mark_type = query_params.get('type')
+        
+        if date_from > date_to or (date_to - date_from).days > MAX_RANGE_DAYS:
+            raise ValueError('Некорректный диапазон дат')
+        if period not in PERIODS or group not in ('period', 'cell'):
+            raise ValueError('Некорректная группировка')
+        if mark_type not in (None, 'tick', 'hogweed'):
+            raise ValueError('Некорректный тип')
+    except ValueError:
+        return bad_request_response()
+    
+    conditions = ['day >= %s', 'day <= %s']
+    params = [date_from, date_to]
+    
+    if mark_type:
+        conditions.append('type = %s')
+        params.append(mark_type)
+    
+    if query_params.get('verified') == 'true':
+        conditions.append('verified = true')
+    
+    where_clause = ' AND '.join(conditions)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        version = get_data_version(cursor, 'marks')
+        # Окно по умолчанию зависит от текущей даты: без него в ключе после полуночи отдавался бы вчерашний ответ
+        etag = build_etag('marks_daily_rollup', version, {
+            **query_params,
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat()
+        })
+        cache_headers = {**headers, 'ETag': etag, 'Cache-Control': PUBLIC_CACHE_CONTROL}
+        
+        if is_not_modified(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': cache_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        if group == 'cell':
+            cursor.execute(f'''
+                SELECT 
+                    cell_lat,
+                    cell_lng,
+                    SUM(CASE WHEN type = 'tick' THEN mark_count ELSE 0 END),
+                    SUM(CASE WHEN type = 'hogweed' THEN mark_count ELSE 0 END),
+                    SUM(CASE WHEN verified THEN mark_count ELSE 0 END),
+                    SUM(mark_count) as total
+                FROM marks_daily_rollup
+                WHERE {where_clause}
+                GROUP BY cell_lat, cell_lng
+                HAVING SUM(mark_count) > 0
+                ORDER BY total DESC
+                LIMIT %s
+            ''', params + [MAX_CELLS])
+            
+            cells = []
+            for row in cursor.fetchall():
+                cells.append({
+                    'lat': round((row[0] + 0.5) * ROLLUP_CELL_SIZE, 4),
+                    'lng': round((row[1] + 0.5) * ROLLUP_CELL_SIZE, 4),
+                    'tick': row[2],
+                    'hogweed': row[3],
+                    'verified': row[4],
+                    'total': row[5]
+                })
+            
+            response_body = {'cells': cells, 'cellSize': ROLLUP_CELL_SIZE}
+        else:
+            cursor.execute(f'''
+                SELECT 
+                    DATE_TRUNC(%s, day)::date as period,
+                    SUM(CASE WHEN type = 'tick' THEN mark_count ELSE 0 END),
+                    SUM(CASE WHEN type = 'hogweed' THEN mark_count ELSE 0 END),
+                    SUM(CASE WHEN verified THEN mark_count ELSE 0 END),
+                    SUM(mark_count)
+                FROM marks_daily_rollup
+                WHERE {where_clause}
+                GROUP BY period
+                ORDER BY period
+            ''', [period] + params)
+            
+            series = []
+            for row in cursor.fetchall():
+                series.append({
+                    'period': row[0].isoformat(),
+                    'tick': row[1],
+                    'hogweed': row[2],
+                    'verified': row[3],
+                    'total': row[4]
+                })
+            
+            response_body = {'series': series, 'period': period}
+        
+        with trace_span('serialize'):
+            body = json.dumps(response_body)
+        
+        return {
+            'statusCode': 200,
+            'headers': cache_headers,
+            'body': body,
+            'isBase64Encoded': False
+        }
+    
+    finally:
+        cursor.close()
+        release_db_connection(conn)
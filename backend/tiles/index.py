@@ -0,0 +1,316 @@
+import base64
+import json
+import math
+import os
+import re
+import struct
+from typing import Dict, Any, List, Optional, Tuple
+from function_runtime import (
+    ResponseCache, bad_request_response, build_etag, cached_response, get_db_connection,
+    is_not_modified, method_not_allowed_response, preflight_headers, release_db_connection,
+    trace_span, traced
+)
+
+MAX_ZOOM = 21
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_CLUSTER_MAX_ZOOM = 10
+TILE_CLUSTER_CELLS = 64
+POLYGON_VERTEX_PATTERN = re.compile(r'\(([-\d.eE+]+),([-\d.eE+]+)\)')
+TILE_PATH_PATTERN = re.compile(r'/(\d+)/(\d+)/(\d+)(?:\.(?:mvt|pbf))?/?$')
+TILE_LAYER_TABLES = ('marks', 'planned_treatments', 'current_treatments')
+
+GEOMETRY_POINT = 1
+GEOMETRY_POLYGON = 3
+COMMAND_MOVE_TO = 1
+COMMAND_LINE_TO = 2
+COMMAND_CLOSE_PATH = 7
+
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+PUBLIC_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 512
+
+PREFLIGHT_HEADERS = preflight_headers('GET, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, base64_body=True)
+
+def get_layers_version(cursor) -> str:
+    cursor.execute(
+        'SELECT table_name, version FROM data_versions WHERE table_name = ANY(%s)',
+        (list(TILE_LAYER_TABLES),)
+    )
+    versions = dict(cursor.fetchall())
+    return '.'.join(str(versions.get(table_name, 0)) for table_name in TILE_LAYER_TABLES)
+
+def parse_tile(event: Dict[str, Any], query_params: Dict[str, str]) -> Tuple[int, int, int]:
+    match = TILE_PATH_PATTERN.search(event.get('path') or '')
+    if match:
+        z, x, y = (int(value) for value in match.groups())
+    else:
+        z, x, y = int(query_params['z']), int(query_params['x']), int(query_params['y'])
+    
+    if z < 0 or z > MAX_ZOOM or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise ValueError('Тайл вне допустимого диапазона')
+    
+    return z, x, y
+
+def tile_bounds(z: int, x: int, y: int, buffer: float = 0) -> Tuple[float, float, float, float]:
+    n = 2 ** z
+    pad = buffer / TILE_EXTENT
+    west = (x - pad) / n * 360.0 - 180.0
+    east = (x + 1 + pad) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y - pad) / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1 + pad) / n))))
+    return west, south, east, north
+
+def project_to_tile(z: int, x: int, y: int, lat: float, lng: float) -> Tuple[int, int]:
+    n = 2 ** z
+    tile_x = (lng + 180.0) / 360.0 * n
+    lat_rad = math.radians(lat)
+    tile_y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return round((tile_x - x) * TILE_EXTENT), round((tile_y - y) * TILE_EXTENT)
+
+def encode_varint(value: int) -> bytes:
+    result = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+def encode_zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+def encode_field(field: int, payload: bytes) -> bytes:
+    return encode_varint((field << 3) | 2) + encode_varint(len(payload)) + payload
+
+def encode_uint_field(field: int, value: int) -> bytes:
+    return encode_varint(field << 3) + encode_varint(value)
+
+def encode_packed(field: int, values: List[int]) -> bytes:
+    return encode_field(field, b''.join(encode_varint(value) for value in values))
+
+def encode_value(value: Any) -> bytes:
+    if isinstance(value, bool):
+        return encode_uint_field(7, int(value))
+    if isinstance(value, int):
+        return encode_uint_field(6, encode_zigzag(value))
+    if isinstance(value, float):
+        return encode_varint((3 << 3) | 1) + struct.pack('<d', value)
+    return encode_field(1, str(value).encode('utf-8'))
+
+def encode_command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+def encode_point_geometry(point: Tuple[int, int]) -> List[int]:
+    return [encode_command(COMMAND_MOVE_TO, 1), encode_zigzag(point[0]), encode_zigzag(point[1])]
+
+def encode_polygon_geometry(ring: List[Tuple[int, int]]) -> List[int]:
+    # Кольцо без повторяющейся последней вершины; внешнее кольцо MVT идет по часовой стрелке в координатах тайла (ось y вниз)
+    if sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])) < 0:
+        ring = ring[::-1]
+    
+    geometry = [encode_command(COMMAND_MOVE_TO, 1), encode_zigzag(ring[0][0]), encode_zigzag(ring[0][1])]
+    geometry.append(encode_command(COMMAND_LINE_TO, len(ring) - 1))
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        geometry.extend((encode_zigzag(x2 - x1), encode_zigzag(y2 - y1)))
+    geometry.append(encode_command(COMMAND_CLOSE_PATH, 1))
+    return geometry
+
+def parse_polygon(value: str) -> List[Tuple[float, float]]:
+    # Текстовое представление polygon из psycopg2: ((lng,lat),(lng,lat),...)
+    return [(float(lng), float(lat)) for lng, lat in POLYGON_VERTEX_PATTERN.findall(value)]
+
+def project_ring(z: int, x: int, y: int, vertices: List[Tuple[float, float]]) -> List[Tuple[int, int]]:
+    ring = []
+    for lng, lat in vertices:
+        point = project_to_tile(z, x, y, lat, lng)
+        if not ring or ring[-1] != point:
+            ring.append(point)
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()
+    return ring
+
+def encode_layer(name: str, features: List[Tuple[Optional[int], int, List[int], Dict[str, Any]]]) -> bytes:
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    encoded_features = []
+    
+    for feature_id, geometry_type, geometry, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        
+        feature = b''
+        if feature_id is not None:
+            feature += encode_uint_field(1, feature_id)
+        feature += encode_packed(2, tags)
+        feature += encode_uint_field(3, geometry_type)
+        feature += encode_packed(4, geometry)
+        encoded_features.append(encode_field(2, feature))
+    
+    layer = encode_uint_field(15, 2) + encode_field(1, name.encode('utf-8'))
+    layer += b''.join(encoded_features)
+    layer += b''.join(encode_field(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(encode_field(4, encode_value(value)) for _, value in values)
+    layer += encode_uint_field(5, TILE_EXTENT)
+    return layer
+
+def fetch_marks_layer(cursor, z: int, x: int, y: int, verified_only: bool) -> List[Tuple[Optional[int], int, List[int], Dict[str, Any]]]:
+    west, south, east, north = tile_bounds(z, x, y, TILE_BUFFER)
+    where_clause = 'point(longitude, latitude) <@ box(point(%s, %s), point(%s, %s))'
+    if verified_only:
+        where_clause += ' AND verified = true'
+    
+    if z <= TILE_CLUSTER_MAX_ZOOM:
+        cell_size = 360.0 / (2 ** z) / TILE_CLUSTER_CELLS
+        cursor.execute(f'''
+            SELECT 
+                COUNT(*),
+                SUM(CASE WHEN type = 'tick' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN type = 'hogweed' THEN 1 ELSE 0 END),
+                AVG(latitude),
+                AVG(longitude)
+            FROM marks
+            WHERE {where_clause}
+            GROUP BY FLOOR(longitude / %s), FLOOR(latitude / %s)
+        ''', (west, south, east, north, cell_size, cell_size))
+        
+        return [
+            (None, GEOMETRY_POINT, encode_point_geometry(project_to_tile(z, x, y, float(row[3]), float(row[4]))), {
+                'count': row[0],
+                'tick': row[1],
+                'hogweed': row[2]
+            })
+            for row in cursor.fetchall()
+        ]
+    
+    cursor.execute(f'''
+        SELECT id, type, latitude, longitude, verified
+        FROM marks
+        WHERE {where_clause}
+    ''', (west, south, east, north))
+    
+    return [
+        (row[0], GEOMETRY_POINT, encode_point_geometry(project_to_tile(z, x, y, float(row[2]), float(row[3]))), {
+            'type': row[1],
+            'verified': bool(row[4])
+        })
+        for row in cursor.fetchall()
+    ]
+
+def fetch_treatments_layer(cursor, z: int, x: int, y: int) -> List[Tuple[Optional[int], int, List[int], Dict[str, Any]]]:
+    west, south, east, north = tile_bounds(z, x, y, TILE_BUFFER)
+    cursor.execute('''
+        SELECT id, 'planned', type, area_name, area, color, planned_date, NULL
+        FROM planned_treatments
+        WHERE area && polygon(box(point(%s, %s), point(%s, %s)))
+        UNION ALL
+        SELECT id, 'current', type, area_name, area, NULL, start_date, end_date
+        FROM current_treatments
+        WHERE status = 'active'
+            AND area && polygon(box(point(%s, %s), point(%s, %s)))
+    ''', (west, south, east, north) * 2)
+    
+    features = []
+    for row in cursor.fetchall():
+        ring = project_ring(z, x, y, parse_polygon(row[4]))
+        # На мелком масштабе зона может схлопнуться в точку или отрезок: тогда она остается на карте точкой
+        if len(ring) >= 3:
+            geometry_type, geometry = GEOMETRY_POLYGON, encode_polygon_geometry(ring)
+        else:
+            geometry_type, geometry = GEOMETRY_POINT, encode_point_geometry(ring[0])
+        features.append((row[0], geometry_type, geometry, {
+            'kind': row[1],
+            'type': row[2],
+            'area': row[3],
+            'color': row[5],
+            'startDate': row[6].isoformat() if row[6] else None,
+            'endDate': row[7].isoformat() if row[7] else None
+        }))
+    return features
+
+def encode_tile(layers: List[Tuple[str, List[Tuple[Optional[int], int, List[int], Dict[str, Any]]]]]) -> bytes:
+    return b''.join(encode_field(3, encode_layer(name, features)) for name, features in layers)
+
+@traced('tiles')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Векторные тайлы (Mapbox Vector Tile) с метками и зонами обработки
+    Args: event - HTTP запрос вида /{z}/{x}/{y}, параметр verified=true
+          context - контекст выполнения функции
+    Returns: Бинарный тайл со слоями marks и treatments
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': PREFLIGHT_HEADERS,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return method_not_allowed_response()
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        z, x, y = parse_tile(event, query_params)
+    except (KeyError, ValueError):
+        return bad_request_response('Укажите тайл в виде /{z}/{x}/{y}')
+    
+    verified_only = query_params.get('verified') == 'true'
+    tile_key = {'z': z, 'x': x, 'y': y, 'verified': verified_only}
+    response_cache_key = json.dumps(tile_key, sort_keys=True)
+    
+    cached = _response_cache.lookup(response_cache_key)
+    if cached:
+        return cached_response(cached, event)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        version = get_layers_version(cursor)
+        
+        cached = _response_cache.lookup(response_cache_key, version)
+        if cached:
+            return cached_response(cached, event)
+        
+        etag = build_etag('tiles', version, tile_key)
+        tile_headers = {
+            'Content-Type': MVT_CONTENT_TYPE,
+            'Access-Control-Allow-Origin': '*',
+            'ETag': etag,
+            'Cache-Control': PUBLIC_CACHE_CONTROL
+        }
+        
+        if is_not_modified(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': tile_headers,
+                'body': '',
+                'isBase64Encoded': True
+            }
+        
+        marks_features = fetch_marks_layer(cursor, z, x, y, verified_only)
+        treatment_features = fetch_treatments_layer(cursor, z, x, y)
+        with trace_span('encode'):
+            tile = encode_tile([('marks', marks_features), ('treatments', treatment_features)])
+        body = base64.b64encode(tile).decode('ascii')
+        
+        _response_cache.store(response_cache_key, version, tile_headers, body)
+        return cached_response(_response_cache[response_cache_key], event)
+    
+    finally:
+        cursor.close()
+        release_db_connection(conn)
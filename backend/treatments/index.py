@@ -1,8 +1,29 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from function_runtime import (
+    JSON_HEADERS, ResponseCache, build_etag, cached_response, check_rate_limit, error_response,
+    fetch_json_fragments, get_admin_token, get_client_ip, get_data_version, get_db_connection,
+    is_not_modified, json_object_text, map_layer_sql, method_not_allowed_response,
+    preflight_headers, release_db_connection, require_admin, trace_span, traced
+)
 
+PUBLIC_CACHE_CONTROL = 'public, max-age=30, stale-while-revalidate=300'
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+RESPONSE_CACHE_MAX_ENTRIES = 128
+
+RATE_LIMIT_POSTS_PER_HOUR = 60
+
+TREATMENT_TABLES = {
+    'planned': 'planned_treatments',
+    'current': 'current_treatments'
+}
+
+PREFLIGHT_HEADERS = preflight_headers('GET, POST, PUT, DELETE, OPTIONS')
+
+_response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+@traced('treatments')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления обработками территорий (запланированные и текущие)
@@ -15,95 +36,65 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': PREFLIGHT_HEADERS,
             'body': '',
             'isBase64Encoded': False
         }
     
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
+    if method == 'GET':
+        response_cache_key = json.dumps(event.get('queryStringParameters') or {}, sort_keys=True)
+        cached = _response_cache.lookup(response_cache_key)
+        if cached:
+            return cached_response(cached, event)
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
-    }
+    headers = JSON_HEADERS
     
     try:
         query_params = event.get('queryStringParameters', {}) or {}
         treatment_type = query_params.get('type', 'planned')
         
-        if method == 'GET':
-            if treatment_type == 'planned':
-                cursor.execute('''
-                    SELECT id, type, area_name, planned_date, coordinates, color, created_by
-                    FROM planned_treatments
-                    ORDER BY planned_date ASC
-                ''')
-                
-                rows = cursor.fetchall()
-                treatments = []
-                for row in rows:
-                    treatments.append({
-                        'id': row[0],
-                        'type': row[1],
-                        'area': row[2],
-                        'date': row[3].isoformat() if row[3] else None,
-                        'coordinates': row[4],
-                        'color': row[5],
-                        'createdBy': row[6]
-                    })
-                
-                return {
-                    'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'treatments': treatments}),
-                    'isBase64Encoded': False
-                }
+        if method == 'GET' and treatment_type in TREATMENT_TABLES:
+            table_name = TREATMENT_TABLES[treatment_type]
+            version = get_data_version(cursor, table_name)
+            etag = build_etag(table_name, version, query_params)
+            cache_headers = {**headers, 'ETag': etag, 'Cache-Control': PUBLIC_CACHE_CONTROL}
             
-            elif treatment_type == 'current':
-                cursor.execute('''
-                    SELECT id, type, area_name, start_date, end_date, coordinates, status, created_by
-                    FROM current_treatments
-                    WHERE status = 'active'
-                    ORDER BY start_date DESC
-                ''')
-                
-                rows = cursor.fetchall()
-                treatments = []
-                for row in rows:
-                    treatments.append({
-                        'id': row[0],
-                        'type': row[1],
-                        'area': row[2],
-                        'startDate': row[3].isoformat() if row[3] else None,
-                        'endDate': row[4].isoformat() if row[4] else None,
-                        'coordinates': row[5],
-                        'status': row[6],
-                        'createdBy': row[7]
-                    })
-                
+            cached = _response_cache.lookup(response_cache_key, version)
+            if cached:
+                return cached_response(cached, event)
+            
+            if is_not_modified(event, etag):
                 return {
-                    'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'treatments': treatments}),
+                    'statusCode': 304,
+                    'headers': cache_headers,
+                    'body': '',
                     'isBase64Encoded': False
                 }
+            
+            # Тот же слой, что отдает bootstrap: строки собираются общим map_layer_sql
+            layer = fetch_json_fragments(cursor, {'treatments': map_layer_sql(treatment_type)})
+            with trace_span('serialize'):
+                body = json_object_text(layer)
+            _response_cache.store(response_cache_key, version, cache_headers, body)
+            
+            return {
+                'statusCode': 200,
+                'headers': cache_headers,
+                'body': body,
+                'isBase64Encoded': False
+            }
         
         elif method == 'POST':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
+            admin_token = get_admin_token(event)
+            
+            if not check_rate_limit(cursor, get_client_ip(event), 'add_treatment', RATE_LIMIT_POSTS_PER_HOUR, RATE_LIMIT_POSTS_PER_HOUR / 3600):
+                return error_response(429, {'error': f'Превышен лимит: максимум {RATE_LIMIT_POSTS_PER_HOUR} обработок в час'})
             
             body_data = json.loads(event.get('body', '{}'))
             
@@ -137,6 +128,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             treatment_id = cursor.fetchone()[0]
             conn.commit()
+            _response_cache.clear()
             
             return {
                 'statusCode': 201,
@@ -146,14 +138,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         elif method == 'DELETE':
-            admin_token = event.get('headers', {}).get('x-admin-token', '')
-            if admin_token not in ['SergSyn', 'IvanGesh']:
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Требуется авторизация администратора'}),
-                    'isBase64Encoded': False
-                }
+            denied = require_admin(event)
+            if denied:
+                return denied
             
             treatment_id = query_params.get('id')
             
@@ -163,6 +150,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cursor.execute('DELETE FROM current_treatments WHERE id = %s', (treatment_id,))
             
             conn.commit()
+            _response_cache.clear()
             
             return {
                 'statusCode': 200,
@@ -173,11 +161,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
     
-    return {
-        'statusCode': 405,
-        'headers': headers,
-        'body': json.dumps({'error': 'Метод не поддерживается'}),
-        'isBase64Encoded': False
-    }
+    return method_not_allowed_response()
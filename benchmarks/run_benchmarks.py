@@ -0,0 +1,327 @@
+'''
+Нагрузочный бенчмарк обработчиков marks, treatments, news и reports.
+Функции вызываются в этом же процессе (как в тёплом экземпляре облачной функции)
+против локальной базы Postgres с синтетическими метками в пределах Москвы и области.
+
+Для каждого сценария измеряются задержка (p50/p95/p99), число SQL-запросов на вызов,
+размер ответа и пиковая память Python; результаты сохраняются в benchmarks/results/
+для сравнения до и после изменений.
+
+Пример:
+    BENCHMARK_DATABASE_URL=postgresql://localhost/tick_bench \
+        python benchmarks/run_benchmarks.py --seed --marks 100000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/20250601-120000-100000.json
+
+Внимание: --seed очищает таблицы меток, обработок и новостей в указанной базе.
+'''
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+# Границы совпадают с ограничением valid_coordinates таблицы marks
+MIN_LATITUDE, MAX_LATITUDE = 54.0, 57.0
+MIN_LONGITUDE, MAX_LONGITUDE = 35.0, 40.0
+MOSCOW_CENTER = (55.7558, 37.6173)
+
+SEED_CHUNK_SIZE = 50000
+SEED_HISTORY_DAYS = 365
+SEED_TREATMENTS = 200
+SEED_NEWS = 200
+WARMUP_CALLS = 3
+
+_query_count = 0
+
+class CountingCursorMixin:
+    # Считает обращения к базе; пакеты FETCH именованных курсоров не учитываются отдельно
+    def execute(self, query, vars=None):
+        global _query_count
+        _query_count += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        global _query_count
+        _query_count += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        global _query_count
+        _query_count += 1
+        return super().copy_expert(sql, file, size)
+
+_psycopg2_connect = psycopg2.connect
+_counting_cursor_classes: Dict[type, type] = {}
+
+def counting_connect(*args, **kwargs):
+    # Подмешивает подсчёт к курсору функции (например, TracingCursor), не заменяя его
+    base = kwargs.get('cursor_factory') or psycopg2.extensions.cursor
+    if base not in _counting_cursor_classes:
+        _counting_cursor_classes[base] = type(f'Counting{base.__name__}', (CountingCursorMixin, base), {})
+    kwargs['cursor_factory'] = _counting_cursor_classes[base]
+    return _psycopg2_connect(*args, **kwargs)
+
+def load_function(name: str):
+    path = os.path.join(ROOT_DIR, 'backend', name, 'index.py')
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(f'{name}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    started = time.perf_counter()
+    spec.loader.exec_module(module)
+    return module, (time.perf_counter() - started) * 1000
+
+def random_point(rng: random.Random) -> tuple:
+    # Две трети меток вокруг Москвы, остальные равномерно по области
+    if rng.random() < 0.66:
+        lat = min(max(rng.gauss(MOSCOW_CENTER[0], 0.25), MIN_LATITUDE), MAX_LATITUDE)
+        lng = min(max(rng.gauss(MOSCOW_CENTER[1], 0.4), MIN_LONGITUDE), MAX_LONGITUDE)
+    else:
+        lat = rng.uniform(MIN_LATITUDE, MAX_LATITUDE)
+        lng = rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE)
+    return round(lat, 6), round(lng, 6)
+
+def seed_database(conn, marks_count: int, rng: random.Random):
+    now = datetime.now()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            TRUNCATE marks, marks_changes, marks_daily_rollup, notification_outbox, rate_limits,
+                planned_treatments, current_treatments, news
+            RESTART IDENTITY
+        ''')
+
+        for start in range(0, marks_count, SEED_CHUNK_SIZE):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for number in range(start, min(start + SEED_CHUNK_SIZE, marks_count)):
+                lat, lng = random_point(rng)
+                created_at = now - timedelta(days=SEED_HISTORY_DAYS * rng.random() ** 2, seconds=rng.randint(0, 86399))
+                verified = rng.random() < 0.8
+                writer.writerow([
+                    rng.choice(('tick', 'hogweed')), lat, lng, verified, f'10.0.{number // 256 % 256}.{number % 256}',
+                    'benchmark', created_at, created_at if verified else None, 'SergSyn' if verified else None,
+                    f'Синтетическая метка {number}'
+                ])
+            buffer.seek(0)
+            cursor.copy_expert('''
+                COPY marks (type, latitude, longitude, verified, user_ip, user_agent, created_at, verified_at, verified_by, description)
+                FROM STDIN WITH (FORMAT csv)
+            ''', buffer)
+            print(f'  метки: {min(start + SEED_CHUNK_SIZE, marks_count)}/{marks_count}', flush=True)
+
+        for number in range(SEED_TREATMENTS):
+            lat, lng = random_point(rng)
+            coordinates = json.dumps({'lat': lat, 'lng': lng})
+            cursor.execute('''
+                INSERT INTO planned_treatments (type, area_name, planned_date, coordinates, color, created_by)
+                VALUES (%s, %s, %s, %s, %s, 'SergSyn')
+            ''', (rng.choice(('tick', 'hogweed')), f'Участок {number}', (now + timedelta(days=rng.randint(0, 60))).date(), coordinates, '#3b82f6'))
+            cursor.execute('''
+                INSERT INTO current_treatments (type, area_name, start_date, end_date, coordinates, created_by)
+                VALUES (%s, %s, %s, %s, %s, 'SergSyn')
+            ''', (rng.choice(('tick', 'hogweed')), f'Участок {number}', (now - timedelta(days=5)).date(), (now + timedelta(days=rng.randint(0, 30))).date(), coordinates))
+
+        for number in range(SEED_NEWS):
+            cursor.execute('''
+                INSERT INTO news (title, content, author, created_at)
+                VALUES (%s, %s, 'SergSyn', %s)
+            ''', (f'Новость {number}', 'Текст новости. ' * 40, now - timedelta(hours=number * 7)))
+
+        cursor.execute('UPDATE data_versions SET version = version + 1')
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    conn.autocommit = False
+
+def get_event(method: str = 'GET', params: Optional[Dict[str, str]] = None, body: Optional[Dict[str, Any]] = None, ip: str = '127.0.0.1') -> Dict[str, Any]:
+    return {
+        'httpMethod': method,
+        'headers': {'accept-encoding': 'gzip'},
+        'queryStringParameters': params or {},
+        'body': json.dumps(body) if body is not None else None,
+        'requestContext': {'identity': {'sourceIp': ip}}
+    }
+
+def build_scenarios(rng: random.Random, latest_seq: int) -> List[Dict[str, Any]]:
+    def post_mark(i: int) -> Dict[str, Any]:
+        lat, lng = random_point(rng)
+        return get_event('POST', body={'type': 'tick', 'latitude': lat, 'longitude': lng, 'description': 'benchmark'}, ip=f'10.99.{i // 256 % 256}.{i % 256}')
+
+    return [
+        {'name': 'marks.list_verified', 'function': 'marks', 'event': lambda i: get_event(params={'verified': 'true'}), 'iterations': 10},
+        {'name': 'marks.first_page', 'function': 'marks', 'event': lambda i: get_event(params={'limit': '100'})},
+        {'name': 'marks.viewport', 'function': 'marks', 'event': lambda i: get_event(params={'bbox': '37.55,55.70,37.70,55.80', 'zoom': '14'})},
+        {'name': 'marks.clustered', 'function': 'marks', 'event': lambda i: get_event(params={'bbox': '35,54,40,57', 'zoom': '8', 'cluster': 'true'})},
+        {'name': 'marks.columnar_viewport', 'function': 'marks', 'event': lambda i: get_event(params={'bbox': '37.3,55.5,37.9,56.0', 'zoom': '11', 'format': 'columnar'})},
+        {'name': 'marks.delta', 'function': 'marks', 'event': lambda i: get_event(params={'since': str(max(latest_seq - 500, 0))})},
+        {'name': 'marks.post', 'function': 'marks', 'event': post_mark, 'cached': False},
+        {'name': 'treatments.planned', 'function': 'treatments', 'event': lambda i: get_event(params={'type': 'planned'})},
+        {'name': 'treatments.current', 'function': 'treatments', 'event': lambda i: get_event(params={'type': 'current'})},
+        {'name': 'news.list', 'function': 'news', 'event': lambda i: get_event()},
+        {'name': 'news.first_page', 'function': 'news', 'event': lambda i: get_event(params={'limit': '20'})},
+        {'name': 'reports.daily', 'function': 'reports', 'event': lambda i: get_event(), 'iterations': 5, 'cached': False},
+        {'name': 'reports.monthly', 'function': 'reports', 'event': lambda i: get_event(params={'period': 'month'}), 'iterations': 5, 'cached': False}
+    ]
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def run_scenario(module, scenario: Dict[str, Any], iterations: int, use_cache: bool) -> Dict[str, Any]:
+    global _query_count
+    event_for: Callable[[int], Dict[str, Any]] = scenario['event']
+    response_cache = getattr(module, '_response_cache', None)
+
+    def invoke(i: int):
+        if not use_cache and response_cache is not None:
+            response_cache.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return module.handler(event_for(i), None)
+
+    for i in range(WARMUP_CALLS):
+        invoke(i)
+
+    latencies = []
+    queries = []
+    sizes = []
+    statuses = set()
+    for i in range(WARMUP_CALLS, WARMUP_CALLS + iterations):
+        _query_count = 0
+        started = time.perf_counter()
+        result = invoke(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(_query_count)
+        sizes.append(len(result.get('body') or ''))
+        statuses.add(result.get('statusCode'))
+
+    tracemalloc.start()
+    invoke(WARMUP_CALLS + iterations)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'name': scenario['name'] + ('' if use_cache else '.uncached'),
+        'iterations': iterations,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'queries_per_call': round(statistics.mean(queries), 2),
+        'response_bytes': round(statistics.mean(sizes)),
+        'peak_memory_kb': round(peak_memory / 1024)
+    }
+
+def print_results(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None):
+    header = f'{"сценарий":<34}{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}{"запросов":>10}{"байт":>12}{"память КБ":>11}'
+    if baseline:
+        header += f'{"p50 было":>11}{"Δp50":>8}'
+    print(header)
+    for result in results:
+        line = (
+            f'{result["name"]:<34}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+            f'{result["queries_per_call"]:>10.1f}{result["response_bytes"]:>12}{result["peak_memory_kb"]:>11}'
+        )
+        previous = (baseline or {}).get(result['name'])
+        if previous:
+            change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0
+            line += f'{previous["p50_ms"]:>11.2f}{change:>+7.0f}%'
+        print(line)
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк обработчиков облачных функций')
+    parser.add_argument('--database-url', default=os.environ.get('BENCHMARK_DATABASE_URL'), help='по умолчанию BENCHMARK_DATABASE_URL')
+    parser.add_argument('--seed', action='store_true', help='очистить таблицы и заполнить синтетическими данными')
+    parser.add_argument('--marks', type=int, default=100000, help='число синтетических меток (10 000 - 1 000 000)')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--only', help='запускать только сценарии, имя которых начинается с этой строки')
+    parser.add_argument('--compare', help='файл с прошлыми результатами для сравнения')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        sys.exit('Укажите базу для бенчмарка: --database-url или BENCHMARK_DATABASE_URL')
+
+    os.environ['DATABASE_URL'] = args.database_url
+    for name in ('TELEGRAM_BOT_TOKEN', 'TELEGRAM_CHAT_ID'):
+        os.environ.pop(name, None)
+    psycopg2.connect = counting_connect
+
+    rng = random.Random(20240501)
+    conn = _psycopg2_connect(args.database_url)
+    if args.seed:
+        print(f'Заполнение базы: {args.marks} меток')
+        seed_database(conn, args.marks, rng)
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM marks')
+        marks_count = cursor.fetchone()[0]
+        cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM marks_changes')
+        latest_seq = cursor.fetchone()[0]
+        cursor.execute('SHOW server_version')
+        server_version = cursor.fetchone()[0]
+    conn.close()
+
+    modules = {}
+    import_times = {}
+    results = []
+    for scenario in build_scenarios(rng, latest_seq):
+        if args.only and not scenario['name'].startswith(args.only):
+            continue
+        if scenario['function'] not in modules:
+            modules[scenario['function']], import_times[scenario['function']] = load_function(scenario['function'])
+        iterations = min(args.iterations, scenario.get('iterations', args.iterations))
+        modes = (True, False) if scenario.get('cached', True) else (False,)
+        for use_cache in modes:
+            results.append(run_scenario(modules[scenario['function']], scenario, iterations, use_cache))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as source:
+            baseline = {result['name']: result for result in json.load(source)['results']}
+
+    print(f'\nМеток в базе: {marks_count}, Postgres {server_version}')
+    print('Импорт модулей, мс: ' + ', '.join(f'{name} {value:.0f}' for name, value in import_times.items()))
+    print_results(results, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{marks_count}.json')
+        with open(path, 'w', encoding='utf-8') as target:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'marks': marks_count,
+                'python': platform.python_version(),
+                'postgres': server_version,
+                'import_ms': {name: round(value, 1) for name, value in import_times.items()},
+                'results': results
+            }, target, ensure_ascii=False, indent=2)
+        print(f'\nРезультаты сохранены: {os.path.relpath(path, ROOT_DIR)}')
+
+if __name__ == '__main__':
+    main()
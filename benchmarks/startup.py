@@ -0,0 +1,110 @@
+'''
+Замер холодного старта облачных функций: время импорта backend/<name>/index.py
+в свежем интерпретаторе, как при первом вызове нового экземпляра функции.
+
+Каждая функция импортируется в отдельном подпроцессе несколько раз, в отчёт
+попадает медиана. Скрипт завершается с кодом 1, если импорт дольше бюджета
+или если при импорте загрузился модуль, который должен подгружаться лениво
+(requests, numpy, openpyxl) — так регрессии холодного старта видны в CI.
+
+Пример:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --only heatmap --importtime
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+
+DEFAULT_BUDGET_MS = 80.0
+
+# Тяжёлые зависимости нужны только отдельным веткам обработчиков и импортируются внутри них
+LAZY_MODULES = ['requests', 'numpy', 'openpyxl']
+
+PROBE = '''
+import importlib.util, json, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('index', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({'import_ms': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+def list_functions() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+def measure_import(name: str) -> Dict[str, Any]:
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, path],
+        check=True, capture_output=True, text=True, env=env, cwd=os.path.join(BACKEND_DIR, name)
+    ).stdout
+    return json.loads(output)
+
+def print_importtime(name: str, limit: int = 15):
+    # -X importtime пишет в stderr собственное и накопленное время каждого импорта в микросекундах
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, path],
+        check=True, capture_output=True, text=True, cwd=os.path.join(BACKEND_DIR, name)
+    ).stderr
+
+    entries = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        module = parts[2].rstrip()
+        if module.startswith('  '):
+            continue
+        entries.append((int(parts[1]) / 1000, module.strip()))
+
+    for cumulative_ms, module in sorted(entries, reverse=True)[:limit]:
+        print(f'    {cumulative_ms:8.1f} мс  {module}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени импорта облачных функций')
+    parser.add_argument('--only', help='замерить только функции, имя которых начинается с этой строки')
+    parser.add_argument('--runs', type=int, default=5, help='число холодных запусков на функцию')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS, help='бюджет на импорт в мс')
+    parser.add_argument('--importtime', action='store_true', help='показать самые дорогие импорты верхнего уровня')
+    args = parser.parse_args()
+
+    names = [name for name in list_functions() if not args.only or name.startswith(args.only)]
+    failures = []
+
+    print(f"{'функция':<16}{'медиана':>10}{'мин':>10}{'бюджет':>10}")
+    for name in names:
+        probes = [measure_import(name) for _ in range(args.runs)]
+        timings = [probe['import_ms'] for probe in probes]
+        median = statistics.median(timings)
+        eager = [module for module in LAZY_MODULES if module in probes[0]['modules']]
+
+        status = ''
+        if median > args.budget:
+            status = 'превышен бюджет'
+            failures.append(name)
+        if eager:
+            status = f"импортируется сразу: {', '.join(eager)}"
+            failures.append(name)
+
+        print(f'{name:<16}{median:>8.1f}мс{min(timings):>8.1f}мс{args.budget:>8.0f}мс  {status}')
+        if args.importtime:
+            print_importtime(name)
+
+    if failures:
+        sys.exit(f"Холодный старт не укладывается в бюджет: {', '.join(sorted(set(failures)))}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+-- Пространственный индекс для выборки меток по видимой области карты
+
+CREATE INDEX IF NOT EXISTS idx_marks_point ON marks USING gist (point(longitude, latitude));
@@ -0,0 +1,4 @@
+-- Индексы для постраничной выборки по курсору (created_at, id)
+
+CREATE INDEX IF NOT EXISTS idx_marks_created_at_id ON marks(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_news_published_created_at_id ON news(created_at, id) WHERE published = true;
@@ -0,0 +1,39 @@
+-- Версии данных для условных GET-запросов (ETag)
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_versions (table_name) VALUES
+('marks'),
+('planned_treatments'),
+('current_treatments'),
+('news')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON marks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+CREATE TRIGGER trg_planned_treatments_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON planned_treatments
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+CREATE TRIGGER trg_current_treatments_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON current_treatments
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+CREATE TRIGGER trg_news_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON news
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
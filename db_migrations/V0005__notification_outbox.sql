@@ -0,0 +1,14 @@
+-- Очередь уведомлений о новых метках (outbox), разбирается функцией notifications
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id SERIAL PRIMARY KEY,
+    mark_id INTEGER REFERENCES marks(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox(next_attempt_at) WHERE sent_at IS NULL;
@@ -0,0 +1,5 @@
+-- Лимиты по алгоритму token bucket: одна атомарная операция вместо SELECT + UPDATE
+
+ALTER TABLE rate_limits ADD COLUMN IF NOT EXISTS tokens DOUBLE PRECISION;
+
+CREATE INDEX IF NOT EXISTS idx_rate_limits_action_last ON rate_limits(action_type, last_action);
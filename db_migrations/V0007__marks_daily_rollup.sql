@@ -0,0 +1,60 @@
+-- Агрегаты меток по дням, типам, ячейкам сетки 0.01° и статусу проверки
+
+CREATE TABLE IF NOT EXISTS marks_daily_rollup (
+    day DATE NOT NULL,
+    type VARCHAR(20) NOT NULL,
+    cell_lat INTEGER NOT NULL,
+    cell_lng INTEGER NOT NULL,
+    verified BOOLEAN NOT NULL,
+    mark_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, type, cell_lat, cell_lng, verified)
+);
+
+CREATE INDEX IF NOT EXISTS idx_marks_daily_rollup_cell ON marks_daily_rollup(cell_lat, cell_lng);
+
+CREATE OR REPLACE FUNCTION update_marks_daily_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE marks_daily_rollup
+        SET mark_count = mark_count - 1
+        WHERE day = OLD.created_at::date
+            AND type = OLD.type
+            AND cell_lat = FLOOR(OLD.latitude * 100)::integer
+            AND cell_lng = FLOOR(OLD.longitude * 100)::integer
+            AND verified = COALESCE(OLD.verified, false);
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO marks_daily_rollup (day, type, cell_lat, cell_lng, verified, mark_count)
+        VALUES (
+            NEW.created_at::date,
+            NEW.type,
+            FLOOR(NEW.latitude * 100)::integer,
+            FLOOR(NEW.longitude * 100)::integer,
+            COALESCE(NEW.verified, false),
+            1
+        )
+        ON CONFLICT (day, type, cell_lat, cell_lng, verified)
+        DO UPDATE SET mark_count = marks_daily_rollup.mark_count + 1;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_daily_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF type, latitude, longitude, verified, created_at ON marks
+    FOR EACH ROW EXECUTE FUNCTION update_marks_daily_rollup();
+
+INSERT INTO marks_daily_rollup (day, type, cell_lat, cell_lng, verified, mark_count)
+SELECT
+    created_at::date,
+    type,
+    FLOOR(latitude * 100)::integer,
+    FLOOR(longitude * 100)::integer,
+    COALESCE(verified, false),
+    COUNT(*)
+FROM marks
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT (day, type, cell_lat, cell_lng, verified)
+DO UPDATE SET mark_count = EXCLUDED.mark_count;
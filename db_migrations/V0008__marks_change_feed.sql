@@ -0,0 +1,32 @@
+-- Журнал изменений меток для дельта-синхронизации (?since=<seq>)
+
+CREATE TABLE IF NOT EXISTS marks_changes (
+    seq BIGSERIAL PRIMARY KEY,
+    mark_id INTEGER NOT NULL,
+    operation VARCHAR(10) NOT NULL CHECK (operation IN ('upsert', 'delete')),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_marks_changes_mark_seq ON marks_changes(mark_id, seq);
+
+-- Блокировка упорядочивает транзакции записи: номера seq видны читателям строго по возрастанию
+CREATE OR REPLACE FUNCTION record_mark_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('marks_changes'));
+    
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO marks_changes (mark_id, operation) VALUES (OLD.id, 'delete');
+    ELSE
+        INSERT INTO marks_changes (mark_id, operation) VALUES (NEW.id, 'upsert');
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_changes
+    AFTER INSERT OR UPDATE OR DELETE ON marks
+    FOR EACH ROW EXECUTE FUNCTION record_mark_change();
+
+INSERT INTO marks_changes (mark_id, operation)
+SELECT id, 'upsert' FROM marks ORDER BY id;
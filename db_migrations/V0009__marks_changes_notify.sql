@@ -0,0 +1,13 @@
+-- Уведомление подписчиков живой ленты (LISTEN marks_changes) о новых изменениях меток
+-- Уведомления без данных внутри одной транзакции схлопываются в одно и доставляются после COMMIT
+
+CREATE OR REPLACE FUNCTION notify_marks_changes() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('marks_changes', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_changes_notify
+    AFTER INSERT ON marks_changes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_marks_changes();
@@ -0,0 +1,94 @@
+-- Агрегаты и журнал изменений меток обновляются один раз на оператор через таблицы переходов,
+-- а не на каждую строку: массовый импорт (COPY) и массовая модерация не платят за построчные триггеры
+
+DROP TRIGGER IF EXISTS trg_marks_daily_rollup ON marks;
+DROP TRIGGER IF EXISTS trg_marks_changes ON marks;
+
+CREATE OR REPLACE FUNCTION update_marks_daily_rollup_batch() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE marks_daily_rollup r
+        SET mark_count = r.mark_count - d.mark_count
+        FROM (
+            SELECT
+                created_at::date AS day,
+                type,
+                FLOOR(latitude * 100)::integer AS cell_lat,
+                FLOOR(longitude * 100)::integer AS cell_lng,
+                COALESCE(verified, false) AS verified,
+                COUNT(*) AS mark_count
+            FROM old_rows
+            GROUP BY 1, 2, 3, 4, 5
+        ) d
+        WHERE r.day = d.day
+            AND r.type = d.type
+            AND r.cell_lat = d.cell_lat
+            AND r.cell_lng = d.cell_lng
+            AND r.verified = d.verified;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO marks_daily_rollup (day, type, cell_lat, cell_lng, verified, mark_count)
+        SELECT
+            created_at::date,
+            type,
+            FLOOR(latitude * 100)::integer,
+            FLOOR(longitude * 100)::integer,
+            COALESCE(verified, false),
+            COUNT(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (day, type, cell_lat, cell_lng, verified)
+        DO UPDATE SET mark_count = marks_daily_rollup.mark_count + EXCLUDED.mark_count;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_daily_rollup_insert
+    AFTER INSERT ON marks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_marks_daily_rollup_batch();
+
+CREATE TRIGGER trg_marks_daily_rollup_update
+    AFTER UPDATE ON marks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_marks_daily_rollup_batch();
+
+CREATE TRIGGER trg_marks_daily_rollup_delete
+    AFTER DELETE ON marks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_marks_daily_rollup_batch();
+
+CREATE OR REPLACE FUNCTION record_mark_changes_batch() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('marks_changes'));
+    
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO marks_changes (mark_id, operation) SELECT id, 'delete' FROM old_rows ORDER BY id;
+    ELSE
+        INSERT INTO marks_changes (mark_id, operation) SELECT id, 'upsert' FROM new_rows ORDER BY id;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_changes_insert
+    AFTER INSERT ON marks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_mark_changes_batch();
+
+CREATE TRIGGER trg_marks_changes_update
+    AFTER UPDATE ON marks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_mark_changes_batch();
+
+CREATE TRIGGER trg_marks_changes_delete
+    AFTER DELETE ON marks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_mark_changes_batch();
+
+DROP FUNCTION IF EXISTS update_marks_daily_rollup();
+DROP FUNCTION IF EXISTS record_mark_change();
@@ -0,0 +1,4 @@
+-- Повторные сообщения о той же точке объединяются с существующей меткой вместо новой строки
+
+ALTER TABLE marks ADD COLUMN IF NOT EXISTS report_count INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE marks ADD COLUMN IF NOT EXISTS last_reported_at TIMESTAMP;
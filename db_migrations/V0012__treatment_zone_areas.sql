@@ -0,0 +1,42 @@
+-- Зоны обработки как многоугольники с GiST-индексом для запросов "метки внутри зоны" и "очаги без обработки"
+-- Зона из одной точки рисуется на карте кругом радиусом 2 км и хранится как 24-угольник того же радиуса
+
+ALTER TABLE planned_treatments ADD COLUMN IF NOT EXISTS area polygon;
+ALTER TABLE current_treatments ADD COLUMN IF NOT EXISTS area polygon;
+
+CREATE OR REPLACE FUNCTION treatment_zone_area(coordinates JSONB) RETURNS polygon AS $$
+    SELECT CASE
+        WHEN jsonb_typeof(coordinates->'polygon') = 'array' THEN (
+            SELECT ('(' || string_agg(format('(%s,%s)', vertex->>0, vertex->>1), ',' ORDER BY position) || ')')::polygon
+            FROM jsonb_array_elements(coordinates->'polygon') WITH ORDINALITY AS ring(vertex, position)
+        )
+        WHEN coordinates ? 'lat' AND coordinates ? 'lng' THEN (
+            SELECT ('(' || string_agg(format('(%s,%s)',
+                (coordinates->>'lng')::float8 + 2000 / (111320 * cos(radians((coordinates->>'lat')::float8))) * cos(2 * pi() * step / 24),
+                (coordinates->>'lat')::float8 + 2000 / 111320.0 * sin(2 * pi() * step / 24)
+            ), ',' ORDER BY step) || ')')::polygon
+            FROM generate_series(0, 23) AS step
+        )
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION set_treatment_zone_area() RETURNS trigger AS $$
+BEGIN
+    NEW.area := treatment_zone_area(NEW.coordinates);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_planned_treatments_area
+    BEFORE INSERT OR UPDATE OF coordinates ON planned_treatments
+    FOR EACH ROW EXECUTE FUNCTION set_treatment_zone_area();
+
+CREATE TRIGGER trg_current_treatments_area
+    BEFORE INSERT OR UPDATE OF coordinates ON current_treatments
+    FOR EACH ROW EXECUTE FUNCTION set_treatment_zone_area();
+
+UPDATE planned_treatments SET area = treatment_zone_area(coordinates);
+UPDATE current_treatments SET area = treatment_zone_area(coordinates);
+
+CREATE INDEX IF NOT EXISTS idx_planned_treatments_area ON planned_treatments USING gist (area);
+CREATE INDEX IF NOT EXISTS idx_current_treatments_area ON current_treatments USING gist (area);
@@ -0,0 +1,94 @@
+-- Готовые части отчетов по дням и собранные файлы отчетов за период.
+-- Версия дня растет при любом изменении меток, созданных в этот день, поэтому часть за прошлый день
+-- пересобирается из marks только после модерации или удаления ее меток
+
+CREATE TABLE IF NOT EXISTS marks_day_versions (
+    day DATE PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO marks_day_versions (day)
+SELECT DISTINCT created_at::date FROM marks WHERE created_at IS NOT NULL
+ON CONFLICT (day) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_marks_day_versions() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE marks_day_versions SET version = version + 1;
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO marks_day_versions (day)
+        SELECT DISTINCT created_at::date FROM old_rows WHERE created_at IS NOT NULL
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET version = marks_day_versions.version + 1;
+    END IF;
+    
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO marks_day_versions (day)
+        SELECT DISTINCT created_at::date FROM new_rows WHERE created_at IS NOT NULL
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET version = marks_day_versions.version + 1;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Дни, куда метка переехала при смене created_at; дни из old_rows уже обновлены выше
+        INSERT INTO marks_day_versions (day)
+        SELECT DISTINCT n.created_at::date FROM new_rows n
+        WHERE n.created_at IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM old_rows o WHERE o.created_at::date = n.created_at::date)
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET version = marks_day_versions.version + 1;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_marks_day_versions_insert
+    AFTER INSERT ON marks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_marks_day_versions();
+
+CREATE TRIGGER trg_marks_day_versions_update
+    AFTER UPDATE ON marks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_marks_day_versions();
+
+CREATE TRIGGER trg_marks_day_versions_delete
+    AFTER DELETE ON marks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_marks_day_versions();
+
+CREATE TRIGGER trg_marks_day_versions_truncate
+    AFTER TRUNCATE ON marks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_marks_day_versions();
+
+-- Строки отчета за день в порядке created_at DESC: [id, тип, широта, долгота, 'DD.MM.YYYY HH24:MI', описание, проверено]
+CREATE TABLE IF NOT EXISTS report_parts (
+    day DATE PRIMARY KEY,
+    version BIGINT NOT NULL,
+    mark_count INTEGER NOT NULL,
+    tick_count INTEGER NOT NULL,
+    hogweed_count INTEGER NOT NULL,
+    verified_count INTEGER NOT NULL,
+    max_id INTEGER,
+    max_description_length INTEGER,
+    rows JSONB NOT NULL,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- version - сумма версий дней периода: растет при любом изменении меток внутри периода
+CREATE TABLE IF NOT EXISTS report_artifacts (
+    date_from DATE NOT NULL,
+    date_to DATE NOT NULL,
+    version BIGINT NOT NULL,
+    mark_count INTEGER NOT NULL,
+    tick_count INTEGER NOT NULL,
+    hogweed_count INTEGER NOT NULL,
+    verified_count INTEGER NOT NULL,
+    workbook BYTEA,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (date_from, date_to)
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_artifacts_built_at ON report_artifacts(built_at);
@@ -0,0 +1,64 @@
+-- Метки без created_at не попадают ни в один день агрегатов: раньше любое изменение такой метки
+-- (проверка, удаление) падало на NOT NULL в marks_daily_rollup.day
+
+CREATE OR REPLACE FUNCTION update_marks_daily_rollup_batch() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE marks_daily_rollup r
+        SET mark_count = r.mark_count - d.mark_count
+        FROM (
+            SELECT
+                created_at::date AS day,
+                type,
+                FLOOR(latitude * 100)::integer AS cell_lat,
+                FLOOR(longitude * 100)::integer AS cell_lng,
+                COALESCE(verified, false) AS verified,
+                COUNT(*) AS mark_count
+            FROM old_rows
+            WHERE created_at IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+        ) d
+        WHERE r.day = d.day
+            AND r.type = d.type
+            AND r.cell_lat = d.cell_lat
+            AND r.cell_lng = d.cell_lng
+            AND r.verified = d.verified;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO marks_daily_rollup (day, type, cell_lat, cell_lng, verified, mark_count)
+        SELECT
+            created_at::date,
+            type,
+            FLOOR(latitude * 100)::integer,
+            FLOOR(longitude * 100)::integer,
+            COALESCE(verified, false),
+            COUNT(*)
+        FROM new_rows
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (day, type, cell_lat, cell_lng, verified)
+        DO UPDATE SET mark_count = marks_daily_rollup.mark_count + EXCLUDED.mark_count;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пересборка агрегатов без недатированных меток: V0007 уже применена и не меняется (контрольная сумма Flyway),
+-- поэтому фильтр ее заполнения повторен здесь. SHARE-блокировка не дает изменить marks во время пересборки
+LOCK TABLE marks IN SHARE MODE;
+
+DELETE FROM marks_daily_rollup;
+
+INSERT INTO marks_daily_rollup (day, type, cell_lat, cell_lng, verified, mark_count)
+SELECT
+    created_at::date,
+    type,
+    FLOOR(latitude * 100)::integer,
+    FLOOR(longitude * 100)::integer,
+    COALESCE(verified, false),
+    COUNT(*)
+FROM marks
+WHERE created_at IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5;
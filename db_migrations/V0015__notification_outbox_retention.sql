@@ -0,0 +1,11 @@
+-- Dead letter для уведомлений: запись, исчерпавшая попытки отправки, получает dead_at и больше не выбирается.
+-- Отправленные и мертвые записи функция notifications удаляет по истечении срока хранения,
+-- поэтому очередь не растет бесконечно
+
+ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS dead_at TIMESTAMP;
+
+DROP INDEX IF EXISTS idx_notification_outbox_pending;
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox(next_attempt_at) WHERE sent_at IS NULL AND dead_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_sent ON notification_outbox(sent_at) WHERE sent_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_dead ON notification_outbox(dead_at) WHERE dead_at IS NOT NULL;
@@ -0,0 +1,91 @@
+-- Журнал изменений меток: запись без блокировки для операторов, не изменивших ни одной строки,
+-- и очистка журнала с горизонтом, ниже которого ?since=<seq> требует полной перезагрузки
+
+-- Горизонт журнала: записи с seq <= horizon могли быть удалены очисткой
+CREATE TABLE IF NOT EXISTS marks_changes_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO marks_changes_horizon (id) VALUES (true) ON CONFLICT (id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_marks_changes_tombstones ON marks_changes(seq) WHERE operation = 'delete';
+
+-- Оператор без строк (UPDATE дедупликации, не нашедший метку) не берет блокировку журнала и не меняет
+-- версию данных; версия меток поднимается здесь же, после блокировки, а не отдельным триггером
+CREATE OR REPLACE FUNCTION record_mark_changes_batch() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+        RETURN NULL;
+    END IF;
+    
+    PERFORM pg_advisory_xact_lock(hashtext('marks_changes'));
+    
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO marks_changes (mark_id, operation) SELECT id, 'delete' FROM old_rows ORDER BY id;
+    ELSE
+        INSERT INTO marks_changes (mark_id, operation) SELECT id, 'upsert' FROM new_rows ORDER BY id;
+    END IF;
+    
+    UPDATE data_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'marks';
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_marks_data_version ON marks;
+
+CREATE TRIGGER trg_marks_data_version_truncate
+    AFTER TRUNCATE ON marks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+-- Очистка журнала: записи, перекрытые более новой записью той же метки, ничего не добавляют к дельте
+-- и удаляются сразу; записи об удалении старше retention_days удаляются с подъемом горизонта.
+-- Возвращает число удаленных записей; за вызов удаляется не больше batch_size записей каждого вида
+CREATE OR REPLACE FUNCTION compact_marks_changes(retention_days INTEGER, batch_size INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    superseded INTEGER;
+    purged INTEGER;
+    purged_seq BIGINT;
+BEGIN
+    DELETE FROM marks_changes
+    WHERE seq IN (
+        SELECT c.seq
+        FROM marks_changes c
+        WHERE EXISTS (
+            SELECT 1 FROM marks_changes n WHERE n.mark_id = c.mark_id AND n.seq > c.seq
+        )
+        LIMIT batch_size
+    );
+    GET DIAGNOSTICS superseded = ROW_COUNT;
+    
+    WITH purged_rows AS (
+        DELETE FROM marks_changes
+        WHERE seq IN (
+            SELECT seq
+            FROM marks_changes
+            WHERE operation = 'delete'
+                AND changed_at < CURRENT_TIMESTAMP - retention_days * INTERVAL '1 day'
+            ORDER BY seq
+            LIMIT batch_size
+        )
+        RETURNING seq
+    )
+    SELECT COUNT(*), MAX(seq) INTO purged, purged_seq FROM purged_rows;
+    
+    IF purged_seq IS NOT NULL THEN
+        UPDATE marks_changes_horizon
+        SET seq = GREATEST(seq, purged_seq), updated_at = CURRENT_TIMESTAMP
+        WHERE id;
+    END IF;
+    
+    RETURN superseded + purged;
+END;
+$$ LANGUAGE plpgsql;
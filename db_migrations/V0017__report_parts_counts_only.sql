@@ -0,0 +1,4 @@
+-- Части отчетов хранят только счетчики и версию дня: строки меток читаются из marks при сборке книги,
+-- поэтому report_parts не дублирует каждую метку
+
+ALTER TABLE report_parts DROP COLUMN IF EXISTS rows;
@@ -0,0 +1,74 @@
+'''
+Локальный запуск облачной функции из backend/<name> как HTTP-сервера.
+Каждый запрос обрабатывается в отдельном потоке, поэтому долгие запросы
+(например, GET /marks?since=<seq>&wait=25) не блокируют остальных клиентов.
+
+Пример: DATABASE_URL=postgresql://... python scripts/dev_server.py marks --port 8001
+'''
+import argparse
+import base64
+import importlib.util
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def load_handler(name: str):
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    # Как на платформе: рядом с index.py лежит копия shared/function_runtime.py
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(f'{name}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+def make_request_handler(handler):
+    class FunctionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def dispatch(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            event = {
+                'httpMethod': self.command,
+                'path': url.path,
+                'headers': {key.lower(): value for key, value in self.headers.items()},
+                'queryStringParameters': dict(parse_qsl(url.query)),
+                'body': self.rfile.read(length).decode('utf-8') if length else '',
+                'requestContext': {'identity': {'sourceIp': self.client_address[0], 'userAgent': self.headers.get('User-Agent', '')}},
+                'isBase64Encoded': False
+            }
+
+            result = handler(event, None)
+            body = result.get('body') or ''
+            payload = base64.b64decode(body) if result.get('isBase64Encoded') else body.encode('utf-8')
+
+            self.send_response(result.get('statusCode', 200))
+            for key, value in (result.get('headers') or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = dispatch
+
+    return FunctionRequestHandler
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный сервер для облачной функции')
+    parser.add_argument('function', help='имя каталога в backend/, например marks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('Не задана переменная DATABASE_URL')
+
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(load_handler(args.function)))
+    print(f'backend/{args.function} доступна на http://{args.host}:{args.port}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Массовый импорт меток и обработок из файла CSV или GeoJSON напрямую в базу.
+Использует ту же проверку и загрузку через COPY, что и функция backend/imports,
+но без ограничения на размер тела запроса и с выводом прогресса.
+
+Пример: DATABASE_URL=postgresql://... python scripts/import_data.py marks season2024.csv --admin SergSyn
+'''
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import psycopg2
+
+IMPORTS_MODULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'imports', 'index.py')
+
+def load_imports_module():
+    sys.path.insert(0, os.path.dirname(IMPORTS_MODULE_PATH))
+    spec = importlib.util.spec_from_file_location('imports_index', IMPORTS_MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    parser = argparse.ArgumentParser(description='Массовый импорт данных из CSV или GeoJSON')
+    parser.add_argument('target', choices=['marks', 'planned', 'current'])
+    parser.add_argument('path', help='путь к файлу .csv или .geojson')
+    parser.add_argument('--format', choices=['csv', 'geojson'], help='по умолчанию определяется по расширению файла')
+    parser.add_argument('--admin', default='SergSyn', help='логин администратора для created_by/verified_by')
+    parser.add_argument('--unverified', action='store_true', help='импортировать метки без подтверждения')
+    parser.add_argument('--skip', type=int, default=0, help='пропустить уже загруженные строки прерванного импорта')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('Не задана переменная DATABASE_URL')
+
+    imports = load_imports_module()
+    data_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'geojson')
+    with open(args.path, encoding='utf-8-sig') as source:
+        content = source.read()
+
+    started = time.monotonic()
+    rows, errors, invalid_count = imports.validate_records(
+        args.target, imports.read_records(content, data_format), args.admin, not args.unverified
+    )
+    print(f'Проверено строк: {len(rows) + invalid_count} за {time.monotonic() - started:.1f} с')
+
+    if invalid_count:
+        for error in errors:
+            print(f'  строка {error["row"]}: {error["error"]}', file=sys.stderr)
+        sys.exit(f'Импорт отменён: {invalid_count} строк с ошибками')
+
+    def report_progress(done: int, total: int):
+        print(f'  загружено {done}/{total} ({done * 100 // total}%)', flush=True)
+
+    rows = rows[args.skip:]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        imported = imports.import_rows(conn, args.target, rows, report_progress)
+    except imports.ImportInterrupted as error:
+        sys.exit(f'Импорт прерван: {error}\nЗагруженные блоки сохранены, продолжите с --skip {args.skip + error.imported}')
+    finally:
+        conn.close()
+
+    print(f'Импортировано {imported} строк за {time.monotonic() - started:.1f} с')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Копирует общие модули из shared/ в каждую облачную функцию backend/<name>/.
+Функции разворачиваются отдельными пакетами из своих каталогов, поэтому общий
+код должен лежать рядом с index.py; правится он только в shared/.
+
+Пример:
+    python scripts/sync_shared.py          # обновить копии
+    python scripts/sync_shared.py --check  # код 1, если копии отличаются от shared/
+'''
+import argparse
+import os
+import sys
+from typing import List
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHARED_DIR = os.path.join(ROOT_DIR, 'shared')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+
+def list_functions() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+def list_shared_modules() -> List[str]:
+    return sorted(name for name in os.listdir(SHARED_DIR) if name.endswith('.py'))
+
+def read_file(path: str) -> bytes:
+    if not os.path.isfile(path):
+        return b''
+    with open(path, 'rb') as f:
+        return f.read()
+
+def main():
+    parser = argparse.ArgumentParser(description='Синхронизация общих модулей облачных функций')
+    parser.add_argument('--check', action='store_true', help='только проверить, что копии совпадают с shared/')
+    args = parser.parse_args()
+
+    outdated = []
+    for module in list_shared_modules():
+        source = read_file(os.path.join(SHARED_DIR, module))
+        for name in list_functions():
+            target = os.path.join(BACKEND_DIR, name, module)
+            if read_file(target) == source:
+                continue
+            
+            outdated.append(f'backend/{name}/{module}')
+            if not args.check:
+                with open(target, 'wb') as f:
+                    f.write(source)
+
+    if args.check and outdated:
+        sys.exit(f"Копии отличаются от shared/: {', '.join(outdated)}. Выполните python scripts/sync_shared.py")
+    for path in outdated:
+        print(f'обновлён {path}')
+
+if __name__ == '__main__':
+    main()
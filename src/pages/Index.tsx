@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { toast } from 'sonner';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
@@ -49,6 +49,8 @@ const Index = () => {
   };
 
   const [marks, setMarks] = useState<any[]>([]);
+  // Номер последнего изменения меток на момент загрузки списка: с него продолжается лента ?since=
+  const marksSeq = useRef<number | null>(null);
   const [loading, setLoading] = useState(true);
   const [newMark, setNewMark] = useState({ type: 'tick', lat: 0, lng: 0, description: '' });
   const [addMarkOpen, setAddMarkOpen] = useState(false);
@@ -64,18 +66,82 @@ const Index = () => {
   const API_TREATMENTS = 'https://functions.poehali.dev/3b5b6f93-220b-4cf2-aad8-4783067093ff';
   const API_NEWS = 'https://functions.poehali.dev/13cce3cc-4cd3-4b16-b6db-185381c2a465';
   const API_REPORTS = 'https://functions.poehali.dev/edb6b64a-815c-45dd-93f2-d09e47199c82';
+  // Адрес функции backend/bootstrap появляется в func2url.json после её развертывания
+  const API_BOOTSTRAP: string | undefined = import.meta.env.VITE_API_BOOTSTRAP;
 
   useEffect(() => {
+    loadMap();
+  }, []);
+
+  useEffect(() => {
+    if (!isAdmin) return;
+
+    let active = true;
+    const followMarkChanges = async () => {
+      // Без загруженного списка лента проигрывается с начала и сама заполняет карту;
+      // если нужная часть журнала уже очищена, сервер отвечает reset и список загружается заново
+      let seq = marksSeq.current ?? 0;
+      let catchingUp = true;
+      while (active) {
+        try {
+          const wait = catchingUp ? '' : '&wait=25';
+          const response = await fetch(`${API_MARKS}?since=${seq}${wait}`, { cache: 'no-store' });
+          const data = await response.json();
+          if (!active) break;
+          if (data.reset) {
+            await loadMarks();
+            seq = marksSeq.current ?? data.seq;
+            catchingUp = true;
+            continue;
+          }
+          const changedIds = new Set([...data.deleted, ...data.marks.map((mark: any) => mark.id)]);
+          setMarks(prev => [...data.marks, ...prev.filter(mark => !changedIds.has(mark.id))]
+            .sort((a, b) => (b.date || '').localeCompare(a.date || '') || b.id - a.id));
+          seq = data.seq;
+          catchingUp = data.hasMore;
+        } catch (error) {
+          console.error('Ошибка получения обновлений меток:', error);
+          await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+      }
+    };
+    followMarkChanges();
+
+    return () => {
+      active = false;
+    };
+  }, [isAdmin]);
+
+  const loadMap = async () => {
+    if (API_BOOTSTRAP) {
+      try {
+        const response = await fetch(API_BOOTSTRAP, { cache: 'no-cache' });
+        if (response.ok) {
+          const data = await response.json();
+          marksSeq.current = data.seq ?? null;
+          setMarks(data.marks || []);
+          setPlannedZones(data.planned || []);
+          setCurrentZones(data.current || []);
+          setNews(data.news || []);
+          setLoading(false);
+          return;
+        }
+      } catch (error) {
+        console.error('Ошибка начальной загрузки карты:', error);
+      }
+    }
+
     loadMarks();
     loadPlannedTreatments();
     loadCurrentTreatments();
     loadNews();
-  }, []);
+  };
 
   const loadMarks = async () => {
     try {
-      const response = await fetch(API_MARKS);
+      const response = await fetch(API_MARKS, { cache: 'no-cache' });
       const data = await response.json();
+      marksSeq.current = data.seq ?? null;
       setMarks(data.marks || []);
     } catch (error) {
       console.error('Ошибка загрузки меток:', error);
@@ -86,7 +152,7 @@ const Index = () => {
 
   const loadPlannedTreatments = async () => {
     try {
-      const response = await fetch(`${API_TREATMENTS}?type=planned`);
+      const response = await fetch(`${API_TREATMENTS}?type=planned`, { cache: 'no-cache' });
       const data = await response.json();
       setPlannedZones(data.treatments || []);
     } catch (error) {
@@ -96,7 +162,7 @@ const Index = () => {
 
   const loadCurrentTreatments = async () => {
     try {
-      const response = await fetch(`${API_TREATMENTS}?type=current`);
+      const response = await fetch(`${API_TREATMENTS}?type=current`, { cache: 'no-cache' });
       const data = await response.json();
       setCurrentZones(data.treatments || []);
     } catch (error) {
@@ -106,7 +172,7 @@ const Index = () => {
 
   const loadNews = async () => {
     try {
-      const response = await fetch(API_NEWS);
+      const response = await fetch(API_NEWS, { cache: 'no-cache' });
       const data = await response.json();
       setNews(data.news || []);
     } catch (error) {
@@ -134,7 +200,7 @@ const Index = () => {
 
       const data = await response.json();
       if (response.ok) {
-        toast.success('Метка добавлена на проверку');
+        toast.success(data.message ?? 'Метка добавлена на проверку');
         setAddMarkOpen(false);
         setNewMark({ type: 'tick', lat: 0, lng: 0, description: '' });
         loadMarks();
@@ -0,0 +1,174 @@
+'''
+Проверка очереди уведомлений backend/notifications против локальной заглушки Telegram:
+TELEGRAM_API_URL указывает на HTTP-сервер в этом же процессе, который запоминает
+сообщения и отвечает заданным кодом.
+
+Первый тест проверяет только отправку и деление дайджеста. Тесты очереди выполняются,
+только если задан DATABASE_URL с применёнными миграциями.
+'''
+import importlib.util
+import json
+import os
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import pytest
+
+NOTIFICATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'notifications')
+
+def load_notifications_module():
+    sys.path.insert(0, NOTIFICATIONS_DIR)
+    spec = importlib.util.spec_from_file_location('notifications_index', os.path.join(NOTIFICATIONS_DIR, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+notifications = load_notifications_module()
+
+requires_database = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='нужна база с миграциями (DATABASE_URL)')
+
+class TelegramStub:
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        self.status = 200
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                stub.messages.append({'path': self.path, 'json': json.loads(self.rfile.read(length))})
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'ok': stub.status == 200}).encode('utf-8'))
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def telegram(monkeypatch):
+    stub = TelegramStub()
+    monkeypatch.setattr(notifications, 'TELEGRAM_API_URL', stub.url)
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test-token')
+    monkeypatch.setenv('TELEGRAM_CHAT_ID', '-100')
+    monkeypatch.setenv('NOTIFICATIONS_SECRET', 'test-secret')
+    yield stub
+    stub.close()
+
+def drain() -> Dict[str, Any]:
+    event = {'httpMethod': 'GET', 'headers': {'x-admin-token': 'test-secret'}, 'queryStringParameters': None}
+    response = notifications.handler(event, None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+def test_long_digest_is_split_into_messages_within_telegram_limit(telegram):
+    rows = [(outbox_id, {'type': 'tick', 'latitude': 55.7, 'longitude': 37.6, 'description': 'ж' * 300}) for outbox_id in range(60)]
+    messages = notifications.build_digest_messages(rows)
+    
+    assert len(messages) > 1
+    assert [outbox_id for ids, _ in messages for outbox_id in ids] == list(range(60))
+    for _, text in messages:
+        notifications.send_message('test-token', '-100', text)
+    
+    assert [message['path'] for message in telegram.messages] == ['/bottest-token/sendMessage'] * len(messages)
+    for message in telegram.messages:
+        assert message['json']['chat_id'] == '-100'
+        assert notifications.telegram_length(message['json']['text']) <= notifications.TELEGRAM_MESSAGE_MAX_LENGTH
+
+@pytest.fixture
+def outbox():
+    import psycopg2
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    marker = uuid.uuid4().hex
+    
+    def insert(count: int, attempts: int = 0) -> List[int]:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO notification_outbox (payload, attempts)
+                SELECT json_build_object('type', 'tick', 'latitude', 55.7, 'longitude', 37.6, 'description', %s || ' ' || n), %s
+                FROM generate_series(1, %s) n
+                RETURNING id
+            ''', (marker, attempts, count))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def age(ids: List[int], column: str, days: int):
+        with conn.cursor() as cursor:
+            cursor.execute(f"UPDATE notification_outbox SET {column} = CURRENT_TIMESTAMP - %s * INTERVAL '1 day' WHERE id = ANY(%s)", (days, ids))
+    
+    def fetch(ids: List[int]) -> List[tuple]:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT sent_at IS NOT NULL, dead_at IS NOT NULL, attempts, last_error
+                FROM notification_outbox WHERE id = ANY(%s) ORDER BY id
+            ''', (ids,))
+            return cursor.fetchall()
+    
+    yield insert, fetch, age, marker
+    
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM notification_outbox WHERE payload->>'description' LIKE %s", (marker + '%',))
+    conn.close()
+
+@requires_database
+def test_drain_sends_queued_marks_as_one_digest(telegram, outbox):
+    insert, fetch, _, marker = outbox
+    # Очередь, накопленная другими тестами, отправляется заранее, чтобы дайджест состоял только из своих строк
+    while drain()['sent']:
+        pass
+    telegram.messages.clear()
+    
+    ids = insert(3)
+    result = drain()
+    
+    assert result['sent'] == 3 and result['failed'] == 0
+    assert len(telegram.messages) == 1
+    assert telegram.messages[0]['json']['text'].count(marker) == 3
+    assert fetch(ids) == [(True, False, 1, None)] * 3
+
+@requires_database
+def test_failed_send_backs_off_and_dead_letters_after_last_attempt(telegram, outbox):
+    insert, fetch, _, _ = outbox
+    while drain()['sent']:
+        pass
+    
+    telegram.status = 500
+    retried = insert(1)
+    exhausted = insert(1, attempts=notifications.OUTBOX_MAX_ATTEMPTS - 1)
+    result = drain()
+    
+    assert result['sent'] == 0 and result['failed'] >= 2 and result['dead'] >= 1
+    (retried_sent, retried_dead, retried_attempts, retried_error), = fetch(retried)
+    assert not retried_sent and not retried_dead and retried_attempts == 1 and '500' in retried_error
+    (exhausted_sent, exhausted_dead, exhausted_attempts, _), = fetch(exhausted)
+    assert not exhausted_sent and exhausted_dead and exhausted_attempts == notifications.OUTBOX_MAX_ATTEMPTS
+    
+    # Строка в dead letter больше не выбирается, даже когда Telegram снова доступен
+    telegram.status = 200
+    drain()
+    assert fetch(exhausted)[0][:2] == (False, True)
+
+@requires_database
+def test_sent_and_dead_rows_are_purged_after_retention(telegram, outbox):
+    insert, fetch, age, _ = outbox
+    old_sent, recent_sent, old_dead = insert(1), insert(1), insert(1)
+    age(old_sent + recent_sent, 'sent_at', notifications.OUTBOX_SENT_RETENTION_DAYS - 1)
+    age(old_sent, 'sent_at', notifications.OUTBOX_SENT_RETENTION_DAYS + 1)
+    age(old_dead, 'dead_at', notifications.OUTBOX_DEAD_RETENTION_DAYS + 1)
+    
+    drain()
+    
+    assert fetch(old_sent) == [] and fetch(old_dead) == []
+    assert len(fetch(recent_sent)) == 1
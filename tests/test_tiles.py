@@ -0,0 +1,210 @@
+'''
+Проверка векторных тайлов backend/tiles: тайл декодируется обратно по спецификации
+Mapbox Vector Tile 2.1 - имена слоев, версия, extent, типы геометрии и кольца зон.
+
+Второй тест запрашивает настоящий тайл с зоной обработки у функции и выполняется,
+только если задан DATABASE_URL с применёнными миграциями.
+'''
+import base64
+import importlib.util
+import math
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+TILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'tiles')
+
+def load_tiles_module():
+    sys.path.insert(0, TILES_DIR)
+    spec = importlib.util.spec_from_file_location('tiles_index', os.path.join(TILES_DIR, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+tiles = load_tiles_module()
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+def read_message(data: bytes) -> List[Tuple[int, Any]]:
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise AssertionError(f'неожиданный тип поля {wire_type}')
+        fields.append((field, value))
+    return fields
+
+def read_packed(data: bytes) -> List[int]:
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+def zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+def decode_geometry(commands: List[int]) -> List[List[Tuple[int, int]]]:
+    # Кольца/точки в абсолютных координатах тайла; ClosePath отмечается повтором первой вершины
+    parts = []
+    x = y = 0
+    pos = 0
+    while pos < len(commands):
+        command, count = commands[pos] & 0x7, commands[pos] >> 3
+        pos += 1
+        if command == tiles.COMMAND_CLOSE_PATH:
+            parts[-1].append(parts[-1][0])
+            continue
+        for _ in range(count):
+            x += zigzag(commands[pos])
+            y += zigzag(commands[pos + 1])
+            pos += 2
+            if command == tiles.COMMAND_MOVE_TO:
+                parts.append([])
+            parts[-1].append((x, y))
+    return parts
+
+def decode_tile(tile: bytes) -> Dict[str, Dict[str, Any]]:
+    layers = {}
+    for field, layer_bytes in read_message(tile):
+        assert field == 3
+        layer = {'features': [], 'keys': [], 'values': []}
+        for layer_field, value in read_message(layer_bytes):
+            if layer_field == 15:
+                layer['version'] = value
+            elif layer_field == 1:
+                layer['name'] = value.decode('utf-8')
+            elif layer_field == 2:
+                layer['features'].append(read_message(value))
+            elif layer_field == 3:
+                layer['keys'].append(value.decode('utf-8'))
+            elif layer_field == 4:
+                layer['values'].append(read_message(value)[0])
+            elif layer_field == 5:
+                layer['extent'] = value
+        
+        features = []
+        for feature_fields in layer['features']:
+            feature = dict((key, value) for key, value in feature_fields if key in (1, 3))
+            tags = read_packed(next(value for key, value in feature_fields if key == 2))
+            properties = {}
+            for key_index, value_index in zip(tags[::2], tags[1::2]):
+                value_type, value = layer['values'][value_index]
+                properties[layer['keys'][key_index]] = value.decode('utf-8') if value_type == 1 else value
+            features.append({
+                'id': feature.get(1),
+                'type': feature[3],
+                'geometry': decode_geometry(read_packed(next(value for key, value in feature_fields if key == 4))),
+                'properties': properties
+            })
+        layers[layer['name']] = {'version': layer['version'], 'extent': layer['extent'], 'features': features}
+    return layers
+
+def signed_area(ring: List[Tuple[int, int]]) -> int:
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+
+def lng_lat_to_tile(z: int, lat: float, lng: float) -> Tuple[int, int]:
+    n = 2 ** z
+    lat_rad = math.radians(lat)
+    return int((lng + 180.0) / 360.0 * n), int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+
+ZONE_POLYGON = '((37.60,55.70),(37.64,55.70),(37.64,55.73),(37.60,55.73))'
+
+def test_encoded_tile_decodes_to_layers_with_points_and_polygons():
+    z = 12
+    x, y = lng_lat_to_tile(z, 55.715, 37.62)
+    mark_point = tiles.project_to_tile(z, x, y, 55.71, 37.61)
+    zone_ring = tiles.project_ring(z, x, y, tiles.parse_polygon(ZONE_POLYGON))
+    tiny_ring = tiles.project_ring(0, 0, 0, tiles.parse_polygon(ZONE_POLYGON))
+    
+    tile = tiles.encode_tile([
+        ('marks', [(7, tiles.GEOMETRY_POINT, tiles.encode_point_geometry(mark_point), {'type': 'tick', 'verified': True})]),
+        ('treatments', [
+            (1, tiles.GEOMETRY_POLYGON, tiles.encode_polygon_geometry(zone_ring), {'kind': 'planned', 'color': None}),
+            (2, tiles.GEOMETRY_POINT, tiles.encode_point_geometry(tiny_ring[0]), {'kind': 'current'})
+        ])
+    ])
+    layers = decode_tile(tile)
+    
+    assert list(layers) == ['marks', 'treatments']
+    for layer in layers.values():
+        assert layer['version'] == 2
+        assert layer['extent'] == tiles.TILE_EXTENT
+    
+    mark = layers['marks']['features'][0]
+    assert mark['id'] == 7 and mark['type'] == tiles.GEOMETRY_POINT
+    assert mark['geometry'] == [[mark_point]]
+    assert mark['properties'] == {'type': 'tick', 'verified': 1}
+    
+    zone, collapsed = layers['treatments']['features']
+    assert zone['type'] == tiles.GEOMETRY_POLYGON
+    assert zone['properties'] == {'kind': 'planned'}
+    ring = zone['geometry'][0]
+    assert len(zone['geometry']) == 1 and len(ring) == 5 and ring[0] == ring[-1]
+    assert sorted(ring[:-1]) == sorted(zone_ring)
+    assert signed_area(ring) > 0
+    
+    assert len(tiny_ring) < 3
+    assert collapsed['type'] == tiles.GEOMETRY_POINT
+
+@pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='нужна база с миграциями (DATABASE_URL)')
+def test_handler_tile_contains_treatment_polygons():
+    import psycopg2
+    
+    with psycopg2.connect(os.environ['DATABASE_URL']) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT id, (@@ area)[0], (@@ area)[1] FROM planned_treatments WHERE area IS NOT NULL LIMIT 1')
+        row = cursor.fetchone()
+    if row is None:
+        pytest.skip('в planned_treatments нет зон')
+    
+    zone_id, lng, lat = row
+    z = 12
+    x, y = lng_lat_to_tile(z, lat, lng)
+    response = tiles.handler({'httpMethod': 'GET', 'path': f'/{z}/{x}/{y}', 'queryStringParameters': {}, 'headers': {}}, None)
+    assert response['statusCode'] == 200
+    assert response['headers']['Content-Type'] == tiles.MVT_CONTENT_TYPE
+    
+    layers = decode_tile(base64.b64decode(response['body']))
+    assert list(layers) == ['marks', 'treatments']
+    assert layers['treatments']['extent'] == tiles.TILE_EXTENT
+    zones = {feature['id']: feature for feature in layers['treatments']['features'] if feature['properties']['kind'] == 'planned'}
+    assert zones[zone_id]['type'] == tiles.GEOMETRY_POLYGON
+    assert signed_area(zones[zone_id]['geometry'][0]) > 0
+
+@pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='нужна база с миграциями (DATABASE_URL)')
+def test_handler_revalidation_returns_304_without_building_tile(monkeypatch):
+    event = {'httpMethod': 'GET', 'path': '/12/2476/1280', 'queryStringParameters': {}, 'headers': {}}
+    etag = tiles.handler(event, None)['headers']['ETag']
+    
+    # Без кэша процесса ответ 304 должен получиться только из версии слоев, не запрашивая и не кодируя тайл
+    tiles._response_cache.clear()
+    def fail(*args, **kwargs):
+        raise AssertionError('тайл не должен собираться при совпавшем ETag')
+    monkeypatch.setattr(tiles, 'fetch_marks_layer', fail)
+    monkeypatch.setattr(tiles, 'encode_tile', fail)
+    
+    response = tiles.handler({**event, 'headers': {'if-none-match': etag}}, None)
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == etag